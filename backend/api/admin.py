@@ -3,6 +3,9 @@ from django.contrib.auth.admin import UserAdmin
 
 from recipes import models as recipes_models
 
+from .cart_totals import apply_component_deltas, get_component_deltas
+from .feed import bump_recipe_feeds
+
 
 class ComponentInline(admin.TabularInline):
     model = recipes_models.Amount
@@ -32,12 +35,26 @@ class RecipeAdmin(admin.ModelAdmin):
         'text',
         'cooking_time',
         'author',
-        'pub_date'
+        'pub_date',
+        'favorites_count'
     )
     list_filter = ('tags',)
     inlines = (ComponentInline,)
     search_fields = ('name', 'author__username', 'author__email')
 
+    def get_amounts(self, recipe):
+        return dict(recipes_models.Amount.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', 'amount'))
+
+    def save_related(self, request, form, formsets, change):
+        old_amounts = self.get_amounts(form.instance)
+        super().save_related(request, form, formsets, change)
+        bump_recipe_feeds(form.instance.pk)
+        apply_component_deltas(form.instance.pk, get_component_deltas(
+            old_amounts, self.get_amounts(form.instance)
+        ))
+
 
 class ShoppingListAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
@@ -1,5 +1,25 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .fulltext import create_search_table
+        from .search import create_ingredient_indexes
+        from .versions import create_cache_table
+
+        post_migrate.connect(
+            create_search_table,
+            sender=apps.get_app_config('recipes')
+        )
+        post_migrate.connect(
+            create_ingredient_indexes,
+            sender=apps.get_app_config('recipes')
+        )
+        post_migrate.connect(
+            create_cache_table,
+            sender=apps.get_app_config('recipes')
+        )
@@ -0,0 +1,59 @@
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .versions import (
+    SHARED_CACHE, bump_versions, get_versions, is_database_backed,
+    is_process_local,
+)
+
+AUTH_TOKEN_CACHE = 'auth_tokens'
+
+
+def get_token_cache_key(key):
+    return f'token:{key}'
+
+
+def get_token_version(key):
+    (version, _), = get_versions(get_token_cache_key(key))
+    return version
+
+
+def evict_tokens(keys):
+    cache_keys = [get_token_cache_key(key) for key in keys]
+    bump_versions(*cache_keys)
+    transaction.on_commit(
+        lambda: caches[AUTH_TOKEN_CACHE].delete_many(cache_keys)
+    )
+
+
+def evict_user_tokens(user_id):
+    evict_tokens(
+        Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+    )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        shared_cache = caches[SHARED_CACHE]
+        if is_process_local(shared_cache) or is_database_backed(shared_cache):
+            # Without a shared version a logout in another worker could
+            # not reach this worker's copy of the token, and a version
+            # kept in the database costs as much as the token lookup.
+            return super().authenticate_credentials(key)
+        cache = caches[AUTH_TOKEN_CACHE]
+        cache_key = get_token_cache_key(key)
+        # Read before the token: an eviction racing with the lookup
+        # below changes the version and retires the entry stored here.
+        version = get_token_version(key)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            token, cached_version = cached
+            if cached_version == version and token.user.is_active:
+                return token.user, token
+            cache.delete(cache_key)
+        user, token = super().authenticate_credentials(key)
+        cache.set(cache_key, (token, version))
+        return user, token
@@ -0,0 +1,157 @@
+from django.db import connections, router, transaction
+from django.db.models import F, Sum
+
+from recipes.models import Amount, ShoppingCartTotal, ShoppingList, User
+
+REBUILD_BATCH_SIZE = 1000
+
+UPSERT_SQL = (
+    'INSERT INTO {totals} ({user}, {ingredient}, {amount}) {rows} '
+    'ON CONFLICT ({user}, {ingredient}) '
+    'DO UPDATE SET {amount} = {totals}.{amount} + excluded.{amount}'
+)
+
+
+def get_sql_names(using):
+    quote_name = connections[using].ops.quote_name
+    totals = ShoppingCartTotal._meta
+    amounts = Amount._meta
+    carts = ShoppingList._meta
+    return {
+        'totals': quote_name(totals.db_table),
+        'user': quote_name(totals.get_field('user').column),
+        'ingredient': quote_name(totals.get_field('ingredient').column),
+        'amount': quote_name(totals.get_field('amount').column),
+        'amounts': quote_name(amounts.db_table),
+        'amount_recipe': quote_name(amounts.get_field('recipe').column),
+        'amount_ingredient': quote_name(
+            amounts.get_field('ingredient').column
+        ),
+        'amount_amount': quote_name(amounts.get_field('amount').column),
+        'carts': quote_name(carts.db_table),
+        'cart_user': quote_name(carts.get_field('user').column),
+        'cart_recipe': quote_name(carts.get_field('recipe').column),
+    }
+
+
+def get_placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def add_recipes_to_totals(user_id, recipe_ids):
+    using = router.db_for_write(ShoppingCartTotal)
+    names = get_sql_names(using)
+    rows = (
+        'SELECT %s, {amount_ingredient}, SUM({amount_amount}) '
+        'FROM {amounts} WHERE {amount_recipe} IN ({recipes}) '
+        'GROUP BY {amount_ingredient}'
+    )
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            UPSERT_SQL.format(rows=rows.format(
+                recipes=get_placeholders(recipe_ids), **names
+            ), **names),
+            (user_id, *recipe_ids)
+        )
+
+
+def subtract_recipes_from_totals(user_id, recipe_ids):
+    using = router.db_for_write(ShoppingCartTotal)
+    names = get_sql_names(using)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'UPDATE {totals} SET {amount} = {totals}.{amount} - removed.total '
+            'FROM (SELECT {amount_ingredient} AS ingredient_id, '
+            'SUM({amount_amount}) AS total FROM {amounts} '
+            'WHERE {amount_recipe} IN ({recipes}) '
+            'GROUP BY {amount_ingredient}) removed '
+            'WHERE {totals}.{user} = %s '
+            'AND {totals}.{ingredient} = removed.ingredient_id'.format(
+                recipes=get_placeholders(recipe_ids), **names
+            ),
+            (*recipe_ids, user_id)
+        )
+        cursor.execute(
+            'DELETE FROM {totals} '
+            'WHERE {user} = %s AND {amount} <= 0'.format(**names),
+            (user_id,)
+        )
+
+
+def get_component_deltas(before, after):
+    deltas = {
+        ingredient_id: after.get(ingredient_id, 0)
+        - before.get(ingredient_id, 0)
+        for ingredient_id in before.keys() | after.keys()
+    }
+    return {
+        ingredient_id: delta for ingredient_id, delta in deltas.items()
+        if delta
+    }
+
+
+def apply_component_deltas(recipe_id, deltas):
+    if not deltas:
+        return
+    using = router.db_for_write(ShoppingCartTotal)
+    names = get_sql_names(using)
+    changed = ' UNION ALL '.join(
+        ['SELECT %s AS ingredient_id, %s AS delta'] * len(deltas)
+    )
+    rows = (
+        'SELECT {cart_user}, changed.ingredient_id, changed.delta '
+        'FROM {carts} CROSS JOIN ({changed}) changed '
+        'WHERE {cart_recipe} = %s'
+    )
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            UPSERT_SQL.format(
+                rows=rows.format(changed=changed, **names), **names
+            ),
+            (*(value for delta in deltas.items() for value in delta),
+             recipe_id)
+        )
+        cursor.execute(
+            'DELETE FROM {totals} WHERE {amount} <= 0 AND {user} IN ('
+            'SELECT {cart_user} FROM {carts} '
+            'WHERE {cart_recipe} = %s)'.format(**names),
+            (recipe_id,)
+        )
+
+
+@transaction.atomic
+def rebuild_cart_totals(user_ids=None):
+    totals = ShoppingCartTotal.objects.all()
+    lookup = {'recipe__shopping_list__isnull': False}
+    if user_ids is not None:
+        list(User.objects.select_for_update().filter(
+            pk__in=user_ids
+        ).values_list('pk', flat=True))
+        totals = totals.filter(user_id__in=user_ids)
+        lookup = {'recipe__shopping_list__user_id__in': user_ids}
+    totals.delete()
+    rows = Amount.objects.filter(**lookup).values_list(
+        'recipe__shopping_list__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by().iterator()
+    created = 0
+    batch = []
+    for user_id, ingredient_id, total in rows:
+        batch.append(ShoppingCartTotal(
+            user_id=user_id,
+            ingredient_id=ingredient_id,
+            amount=total
+        ))
+        if len(batch) == REBUILD_BATCH_SIZE:
+            created += len(ShoppingCartTotal.objects.bulk_create(batch))
+            batch = []
+    created += len(ShoppingCartTotal.objects.bulk_create(batch))
+    return created
+
+
+def get_cart_totals(user):
+    return ShoppingCartTotal.objects.filter(user=user).values(
+        'ingredient_id',
+        'amount',
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit')
+    ).order_by('ingredient__name')
@@ -0,0 +1,116 @@
+import csv
+import uuid
+
+from django.core.cache import cache, caches
+from django.db import transaction
+from rest_framework.renderers import BaseRenderer
+
+from foodgram.settings import SHOPPING_CART_CACHE_TIMEOUT
+
+from .versions import SHARED_CACHE, get_version_timeout
+
+SHOPPING_CART_HEADER = 'Список покупок:'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    charset = 'utf-8'
+
+    def iter_lines(self, ingredients):
+        for item, ingredient in enumerate(ingredients, start=1):
+            yield (
+                f'{item}) '
+                f'{ingredient["name"]} - '
+                f'{ingredient["amount"]}, {ingredient["measurement_unit"]}'
+            )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            # Error responses are not shopping lists: send them as text.
+            renderer_context['response']['Content-Type'] = (
+                'text/plain; charset=utf-8'
+            )
+            return str(data.get('detail', data)).encode('utf-8')
+        return b''.join(self.stream(data))
+
+
+class PDFShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def stream(self, ingredients):
+        from .pdf import render_pdf
+
+        return render_pdf(SHOPPING_CART_HEADER, self.iter_lines(ingredients))
+
+
+class TXTShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        yield f'{SHOPPING_CART_HEADER}\n'.encode(self.charset)
+        for line in self.iter_lines(ingredients):
+            yield f'{line}\n'.encode(self.charset)
+
+
+class CSVShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('name', 'amount', 'measurement_unit')
+        ).encode(self.charset)
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient['name'],
+                ingredient['amount'],
+                ingredient['measurement_unit'],
+            )).encode(self.charset)
+
+
+SHOPPING_CART_RENDERERS = (
+    PDFShoppingCartRenderer,
+    TXTShoppingCartRenderer,
+    CSVShoppingCartRenderer,
+)
+
+
+def get_shopping_cart_version_key(user_id):
+    return f'shopping_cart_version:{user_id}'
+
+
+def get_shopping_cart_cache_key(user, file_format):
+    # The version is shared between workers, so a cart change seen by one
+    # of them retires the files every worker has rendered for this user.
+    shared_cache = caches[SHARED_CACHE]
+    version = shared_cache.get_or_set(
+        get_shopping_cart_version_key(user.pk),
+        uuid.uuid4().hex,
+        get_version_timeout(shared_cache)
+    )
+    return f'shopping_cart:{user.pk}:{version}:{file_format}'
+
+
+def invalidate_shopping_carts(user_ids):
+    keys = [get_shopping_cart_version_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    # Like bump_versions: a delete before commit would let a concurrent
+    # export cache the old cart under the version it creates next.
+    transaction.on_commit(lambda: caches[SHARED_CACHE].delete_many(keys))
+
+
+def cached_stream(cache_key, chunks):
+    content = []
+    for chunk in chunks:
+        content.append(chunk)
+        yield chunk
+    cache.set(cache_key, b''.join(content), SHOPPING_CART_CACHE_TIMEOUT)
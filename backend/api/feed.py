@@ -0,0 +1,97 @@
+import hashlib
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+
+from foodgram.settings import RECIPE_FEED_CACHE_TIMEOUT
+from recipes.models import Favorite, Follow, Recipe, ShoppingList
+
+from .versions import bump_versions, get_versions
+
+FEED_PARAMS = frozenset((
+    'tags', 'author', 'page', 'limit', 'pagination', 'cursor', 'count',
+    'ordering',
+))
+
+ANONYMOUS_USER = AnonymousUser()
+
+
+def get_feed_cache_key(request):
+    params = request.query_params
+    if not FEED_PARAMS.issuperset(params):
+        return None
+    tags = sorted(set(params.getlist('tags')))
+    author = params.get('author', '')
+    names = ['feed']
+    names += [f'feed:tag:{slug}' for slug in tags]
+    if author:
+        names.append(f'feed:author:{author}')
+    if not tags and not author:
+        names.append('feed:all')
+    versions = get_versions(*names)
+    key = '|'.join((
+        request.get_host(),
+        ','.join(tags),
+        author,
+        params.get('page', ''),
+        params.get('limit', ''),
+        params.get('pagination', ''),
+        params.get('cursor', ''),
+        params.get('count', ''),
+        params.get('ordering', ''),
+        *(token for token, _ in versions),
+    ))
+    return 'feed:' + hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def get_cached_feed(cache_key, build):
+    data = cache.get(cache_key)
+    if data is None:
+        data = build(ANONYMOUS_USER)
+        cache.set(cache_key, data, RECIPE_FEED_CACHE_TIMEOUT)
+    return data
+
+
+def overlay_viewer_flags(data, user):
+    recipes = data['results']
+    recipe_ids = [recipe['id'] for recipe in recipes]
+    author_ids = {recipe['author']['id'] for recipe in recipes}
+    favorited = set(Favorite.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    in_shopping_cart = set(ShoppingList.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    subscribed = set(Follow.objects.filter(
+        user=user, author_id__in=author_ids
+    ).values_list('author_id', flat=True))
+    for recipe in recipes:
+        recipe['is_favorited'] = recipe['id'] in favorited
+        recipe['is_in_shopping_cart'] = recipe['id'] in in_shopping_cart
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in subscribed
+        )
+    return data
+
+
+def bump_recipe_feeds(recipe_id):
+    rows = Recipe.objects.filter(pk=recipe_id).values_list(
+        'author_id', 'tags__slug'
+    )
+    names = {'feed:all', f'recipe:{recipe_id}'}
+    for author_id, slug in rows:
+        names.add(f'feed:author:{author_id}')
+        if slug is not None:
+            names.add(f'feed:tag:{slug}')
+    bump_versions(*names)
+
+
+def bump_author_feeds(author_id):
+    slugs = set(Recipe.objects.filter(author_id=author_id).values_list(
+        'tags__slug', flat=True
+    ).distinct())
+    if not slugs:
+        return
+    names = {'feed:all', f'feed:author:{author_id}'}
+    names.update(f'feed:tag:{slug}' for slug in slugs if slug is not None)
+    bump_versions(*names)
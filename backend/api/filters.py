@@ -1,16 +1,55 @@
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 from django_filters import FilterSet, filters
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 
-from recipes.models import Recipe
+from foodgram.settings import TAG_IDS_CACHE_TTL
+from recipes.models import Recipe, Tag
 
+from .paginations import CursorLimitPagination
+from .popularity import RECIPE_ORDERINGS
+from .versions import get_versions
 
-class IngredientsFilter(SearchFilter):
-    search_param = 'name'
+
+def get_tag_ids(slugs):
+    (token, _), = get_versions('tags')
+    cache_key = f'tag_ids:{token}'
+    tag_ids = cache.get(cache_key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(cache_key, tag_ids, TAG_IDS_CACHE_TTL)
+    missing = set(slugs) - tag_ids.keys()
+    if missing:
+        # A tag created in another process may not have bumped the
+        # version this process sees yet: ask the database before
+        # treating the slug as unknown.
+        found = dict(Tag.objects.filter(
+            slug__in=missing
+        ).values_list('slug', 'id'))
+        if found:
+            tag_ids = {**tag_ids, **found}
+            cache.set(cache_key, tag_ids, TAG_IDS_CACHE_TTL)
+    return {tag_ids[slug] for slug in slugs if slug in tag_ids}
+
+
+def filter_by_annotation(queryset, name, expression):
+    queryset = queryset.annotate(
+        **{name: expression}
+    ).filter(**{name: True})
+    # Keep the condition in WHERE only: selecting it as well would make
+    # the database evaluate the subquery a second time for every row.
+    queryset.query.set_annotation_mask(
+        set(queryset.query.annotation_select) - {name}
+    )
+    return queryset
+
+
+def filter_exists(queryset, name, subquery):
+    return filter_by_annotation(queryset, name, Exists(subquery))
 
 
 class RecipesFilter(FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug',
-                                           lookup_expr='contains')
+    tags = filters.CharFilter(method='filter_tags')
     author = filters.NumberFilter(field_name='author__id')
     is_favorited = filters.NumberFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.NumberFilter(
@@ -21,14 +60,49 @@ class RecipesFilter(FilterSet):
         model = Recipe
         fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',)
 
+    def filter_tags(self, queryset, name, value):
+        tag_ids = get_tag_ids(self.data.getlist(name))
+        if not tag_ids:
+            return queryset.none()
+        return filter_exists(
+            queryset,
+            'has_tags',
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag_id__in=tag_ids
+            )
+        )
+
+    def filter_by_user_flag(self, queryset, flag, value):
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none() if value else queryset
+        if flag not in queryset.query.annotations:
+            queryset = queryset.with_user_flags(user)
+        return queryset.filter(**{flag: bool(value)})
+
     def filter_is_favorited(self, queryset, name, value):
-        if value == 1:
-            return queryset.filter(favorites__user=self.request.user)
-        else:
-            return queryset.filter(favorites__user__isnull=True)
+        return self.filter_by_user_flag(queryset, 'is_favorited', value)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        if value == 1:
-            return queryset.filter(shopping_list__user=self.request.user)
-        else:
-            return queryset.filter(shopping_list__user__isnull=True)
+        return self.filter_by_user_flag(
+            queryset, 'is_in_shopping_cart', value
+        )
+
+
+class RecipeOrderingFilter(BaseFilterBackend):
+    ordering_param = 'ordering'
+
+    def get_ordering(self, request, queryset, view):
+        return RECIPE_ORDERINGS.get(
+            request.query_params.get(self.ordering_param),
+            CursorLimitPagination.ordering
+        )
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = RECIPE_ORDERINGS.get(
+            request.query_params.get(self.ordering_param)
+        )
+        if ordering is None:
+            return queryset
+        return queryset.order_by(*ordering)
@@ -0,0 +1,196 @@
+from django.db import connections, router
+from django.db.models import BooleanField, Exists, FloatField, OuterRef, Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+
+from foodgram.settings import FULLTEXT_SEARCH_CONFIG
+from recipes.models import Amount, Recipe
+
+from .filters import filter_by_annotation
+
+SEARCH_TABLE = 'recipes_recipe_search'
+
+INDEX_BATCH_SIZE = 1000
+
+SEARCH_SQL = {
+    'postgresql': {
+        'create': (
+            'CREATE TABLE IF NOT EXISTS {table} ('
+            'recipe_id integer PRIMARY KEY REFERENCES {recipes} (id) '
+            'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS {index} '
+            'ON {table} USING gin (document)',
+        ),
+        'upsert': (
+            'INSERT INTO {table} (recipe_id, document) VALUES (%s, '
+            "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, %s), 'B') || "
+            "setweight(to_tsvector(%s::regconfig, %s), 'C')) "
+            'ON CONFLICT (recipe_id) '
+            'DO UPDATE SET document = excluded.document'
+        ),
+        'delete': 'DELETE FROM {table} WHERE recipe_id = %s',
+        'match': (
+            '{recipes}.id IN (SELECT recipe_id FROM {table} '
+            'WHERE document @@ websearch_to_tsquery(%s::regconfig, %s))'
+        ),
+        'rank': (
+            'SELECT ts_rank_cd(document, '
+            'websearch_to_tsquery(%s::regconfig, %s)) '
+            'FROM {table} WHERE recipe_id = {recipes}.id'
+        ),
+    },
+    'sqlite': {
+        'create': (
+            'CREATE VIRTUAL TABLE IF NOT EXISTS {table} '
+            "USING fts5(name, text, ingredients, tokenize='unicode61')",
+        ),
+        'upsert': (
+            'INSERT OR REPLACE INTO {table} (rowid, name, text, ingredients) '
+            'VALUES (%s, %s, %s, %s)'
+        ),
+        'delete': 'DELETE FROM {table} WHERE rowid = %s',
+        'match': (
+            '{recipes}.id IN '
+            '(SELECT rowid FROM {table} WHERE {table} MATCH %s)'
+        ),
+        'rank': (
+            'SELECT -bm25({table}, 10.0, 1.0, 4.0) FROM {table} '
+            'WHERE {table} MATCH %s AND rowid = {recipes}.id'
+        ),
+    },
+}
+
+
+def get_search_sql(using, statement):
+    connection = connections[using]
+    statements = SEARCH_SQL.get(connection.vendor)
+    if statements is None:
+        return None
+    quote_name = connection.ops.quote_name
+    names = {
+        'table': quote_name(SEARCH_TABLE),
+        'index': quote_name(f'{SEARCH_TABLE}_document'),
+        'recipes': quote_name(Recipe._meta.db_table),
+    }
+    sql = statements[statement]
+    if isinstance(sql, tuple):
+        return tuple(part.format(**names) for part in sql)
+    return sql.format(**names)
+
+
+def get_search_params(using, query):
+    if connections[using].vendor == 'postgresql':
+        return (FULLTEXT_SEARCH_CONFIG, query)
+    return (' '.join(
+        '"{}"'.format(word.replace('"', '""')) for word in query.split()
+    ),)
+
+
+def get_index_params(using, recipe_id, name, text, ingredients):
+    if connections[using].vendor == 'postgresql':
+        return (
+            recipe_id,
+            FULLTEXT_SEARCH_CONFIG, name,
+            FULLTEXT_SEARCH_CONFIG, ingredients,
+            FULLTEXT_SEARCH_CONFIG, text,
+        )
+    return (recipe_id, name, text, ingredients)
+
+
+def create_search_table(using='default', **kwargs):
+    statements = get_search_sql(using, 'create')
+    if statements is None:
+        return
+    with connections[using].cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def index_recipes(recipe_ids):
+    using = router.db_for_write(Recipe)
+    upsert = get_search_sql(using, 'upsert')
+    if upsert is None:
+        return
+    recipe_ids = set(recipe_ids)
+    recipes = Recipe.objects.using(using).filter(
+        id__in=recipe_ids
+    ).values_list('id', 'name', 'text').order_by()
+    ingredients = {}
+    for recipe_id, name in Amount.objects.using(using).filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient__name').order_by():
+        ingredients.setdefault(recipe_id, []).append(name)
+    rows = [
+        get_index_params(
+            using, recipe_id, name, text,
+            ' '.join(ingredients.get(recipe_id, ()))
+        )
+        for recipe_id, name, text in recipes
+    ]
+    missing = recipe_ids - {row[0] for row in rows}
+    with connections[using].cursor() as cursor:
+        cursor.executemany(upsert, rows)
+        cursor.executemany(
+            get_search_sql(using, 'delete'),
+            [(recipe_id,) for recipe_id in missing]
+        )
+
+
+def index_recipes_in_batches(recipe_ids):
+    batch = []
+    count = 0
+    for recipe_id in recipe_ids:
+        batch.append(recipe_id)
+        if len(batch) == INDEX_BATCH_SIZE:
+            index_recipes(batch)
+            count += len(batch)
+            batch = []
+    index_recipes(batch)
+    return count + len(batch)
+
+
+def rebuild_search_index():
+    using = router.db_for_write(Recipe)
+    create_search_table(using)
+    return index_recipes_in_batches(Recipe.objects.using(using).values_list(
+        'id', flat=True
+    ).order_by('id').iterator())
+
+
+def search_recipes(queryset, query):
+    match = get_search_sql(queryset.db, 'match')
+    if match is None:
+        return queryset.annotate(
+            ingredient_matches=Exists(Amount.objects.filter(
+                recipe=OuterRef('pk'),
+                ingredient__name__icontains=query
+            ))
+        ).filter(
+            Q(name__icontains=query)
+            | Q(text__icontains=query)
+            | Q(ingredient_matches=True)
+        )
+    params = get_search_params(queryset.db, query)
+    return filter_by_annotation(
+        queryset,
+        'search_match',
+        RawSQL(match, params, output_field=BooleanField())
+    ).annotate(
+        search_rank=RawSQL(
+            get_search_sql(queryset.db, 'rank'),
+            params,
+            output_field=FloatField()
+        )
+    ).order_by('-search_rank', '-pub_date', '-id')
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search_recipes(queryset, query)
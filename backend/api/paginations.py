@@ -1,5 +1,139 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+def reverse_ordering(ordering):
+    return tuple(
+        order[1:] if order.startswith('-') else f'-{order}'
+        for order in ordering
+    )
+
+
+class CursorLimitPagination(CursorPagination):
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+    count_query_param = 'count'
+
+    # DRF keeps only the first ordering field in the cursor and steps over
+    # ties with an offset, which turns into a scan on columns with many
+    # equal values. Here the cursor holds every ordering field, all of
+    # which end with the unique id, so a page is one index range.
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in (
+            '1', 'true'
+        ):
+            self.count = queryset.count()
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse, position = False, None
+        if self.cursor is not None:
+            reverse, position = self.cursor.reverse, self.cursor.position
+        ordering = reverse_ordering(self.ordering) if reverse else (
+            self.ordering
+        )
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_keyset_filter(queryset, ordering, position)
+            )
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+        if reverse:
+            self.page.reverse()
+            self.next_position, self.previous_position = (
+                position, following_position
+            )
+        else:
+            self.next_position, self.previous_position = (
+                following_position, position
+            )
+        self.has_next = self.next_position is not None
+        self.has_previous = self.previous_position is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def get_keyset_filter(self, queryset, ordering, position):
+        opts = queryset.model._meta
+        names = [order.lstrip('-') for order in ordering]
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(names):
+                raise ValueError
+            values = [
+                (opts.pk if name == 'pk' else opts.get_field(name)).to_python(
+                    value
+                )
+                for name, value in zip(names, values)
+            ]
+        except (ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        after = None
+        for order, name, value in reversed(
+            tuple(zip(ordering, names, values))
+        ):
+            lookup = 'lt' if order.startswith('-') else 'gt'
+            condition = Q(**{f'{name}__{lookup}': value})
+            if after is not None:
+                condition |= Q(**{name: value}) & after
+            after = condition
+        lookup = 'lte' if ordering[0].startswith('-') else 'gte'
+        # The redundant bound on the first field lets the database start
+        # the index scan at the cursor instead of filtering from the top.
+        return Q(**{f'{names[0]}__{lookup}': values[0]}) & after
+
+    def _get_position_from_instance(self, instance, ordering):
+        return json.dumps([
+            instance[name] if isinstance(instance, dict)
+            else getattr(instance, name)
+            for name in (order.lstrip('-') for order in ordering)
+        ], default=str)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict((
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ))
+        if self.count is not None:
+            response['count'] = self.count
+            response.move_to_end('count', last=False)
+        return Response(response)
+
+
+class UserCursorPagination(CursorLimitPagination):
+    ordering = ('id',)
+
+
+class CursorOptInMixin:
+    cursor_pagination_class = CursorLimitPagination
+    cursor_switch_param = 'pagination'
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get(
+                self.cursor_switch_param
+            ) == 'cursor':
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
@@ -0,0 +1,261 @@
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import Counter, OrderedDict, namedtuple
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Q
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from foodgram.settings import (
+    PANTRY_CHANGE_OVERLAP, PANTRY_CHANGE_RETENTION, PANTRY_INDEX_BACKGROUND,
+    PANTRY_INDEX_TTL, PANTRY_MAX_MISSING, PANTRY_MAX_PENDING_CHANGES,
+    PANTRY_READY_TIMEOUT, PANTRY_REFRESH_INTERVAL, PANTRY_RESULT_CACHE_SIZE,
+)
+from recipes.models import Amount, Recipe, RecipeChange
+
+logger = logging.getLogger(__name__)
+
+PantryState = namedtuple(
+    'PantryState',
+    ('prefixes', 'frequencies', 'recipes', 'sequence', 'seen', 'loaded_at')
+)
+
+EMPTY_PREFIX = (array('b'), array('l'))
+
+
+def record_recipe_change(recipe_id):
+    RecipeChange.objects.create(recipe_id=recipe_id)
+
+
+def get_recent_changes(sequence, limit=None):
+    changes = RecipeChange.objects.filter(
+        pk__gt=sequence - PANTRY_CHANGE_OVERLAP
+    ).values_list('pk', 'recipe_id').order_by('pk')
+    if limit is not None:
+        changes = changes[:limit]
+    return list(changes)
+
+
+def get_seen(changes, sequence):
+    return frozenset(
+        pk for pk, _ in changes if pk > sequence - PANTRY_CHANGE_OVERLAP
+    )
+
+
+def query_pantry(ingredient_ids, missing):
+    return list(Recipe.objects.annotate(
+        size=Count('components'),
+        matched=Count(
+            'components',
+            filter=Q(components__ingredient_id__in=ingredient_ids)
+        ),
+    ).annotate(
+        lacking=F('size') - F('matched'),
+        share=ExpressionWrapper(
+            Cast('matched', FloatField()) / F('size'),
+            output_field=FloatField()
+        ),
+    ).filter(
+        matched__gt=0,
+        lacking__lte=missing
+    ).order_by('lacking', '-share', '-id').values_list('id', flat=True))
+
+
+def get_prefix(ingredient_ids, frequencies):
+    # A recipe lacking at most PANTRY_MAX_MISSING ingredients has one of
+    # any PANTRY_MAX_MISSING + 1 of them in the pantry. Indexing only the
+    # rarest ones keeps common ingredients like salt out of most lists.
+    return sorted(
+        ingredient_ids,
+        key=lambda ingredient_id: frequencies.get(ingredient_id, 0)
+    )[:PANTRY_MAX_MISSING + 1]
+
+
+def pack_prefix(entries):
+    entries.sort()
+    return (
+        array('b', (position for position, _ in entries)),
+        array('l', (recipe_id for _, recipe_id in entries)),
+    )
+
+
+def get_prefix_entries(recipes, recipe_ids, frequencies):
+    entries = {}
+    for recipe_id in recipe_ids:
+        for position, ingredient_id in enumerate(get_prefix(
+            recipes.get(recipe_id, ()), frequencies
+        )):
+            entries.setdefault(ingredient_id, []).append(
+                (position, recipe_id)
+            )
+    return entries
+
+
+class PantryIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.thread = None
+        self.state = None
+        self.results = OrderedDict()
+
+    def is_expired(self, state):
+        return time.monotonic() - state.loaded_at > PANTRY_INDEX_TTL
+
+    def swap(self, state):
+        with self.lock:
+            self.state = state
+            self.results.clear()
+        self.ready.set()
+
+    def load(self):
+        sequence = RecipeChange.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        changes = get_recent_changes(sequence)
+        recipes = {}
+        for recipe_id, ingredient_id in Amount.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).order_by('recipe_id').iterator():
+            recipes.setdefault(recipe_id, []).append(ingredient_id)
+        frequencies = Counter()
+        for recipe_id, ingredient_ids in recipes.items():
+            recipes[recipe_id] = tuple(ingredient_ids)
+            frequencies.update(ingredient_ids)
+        prefixes = {
+            ingredient_id: pack_prefix(entries)
+            for ingredient_id, entries in get_prefix_entries(
+                recipes, recipes, frequencies
+            ).items()
+        }
+        RecipeChange.objects.filter(
+            changed_at__lt=timezone.now() - timedelta(
+                seconds=PANTRY_CHANGE_RETENTION
+            )
+        ).delete()
+        return PantryState(
+            prefixes, frequencies, recipes, sequence,
+            get_seen(changes, sequence), time.monotonic()
+        )
+
+    def apply_changes(self, state, recipe_ids, sequence, seen):
+        # Build changed copies, so that searches running against the old
+        # state never see half-updated prefixes.
+        prefixes = dict(state.prefixes)
+        recipes = dict(state.recipes)
+        touched = set(get_prefix_entries(
+            recipes, recipe_ids, state.frequencies
+        ))
+        for recipe_id in recipe_ids:
+            recipes.pop(recipe_id, None)
+        for recipe_id, ingredient_id in Amount.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            recipes[recipe_id] = recipes.get(recipe_id, ()) + (ingredient_id,)
+        added = get_prefix_entries(recipes, recipe_ids, state.frequencies)
+        for ingredient_id in touched | set(added):
+            positions, prefix_ids = prefixes.get(ingredient_id, EMPTY_PREFIX)
+            prefixes[ingredient_id] = pack_prefix([
+                (position, recipe_id)
+                for position, recipe_id in zip(positions, prefix_ids)
+                if recipe_id not in recipe_ids
+            ] + added.get(ingredient_id, []))
+        return PantryState(
+            prefixes, state.frequencies, recipes, sequence, seen,
+            state.loaded_at
+        )
+
+    def refresh(self):
+        state = self.state
+        if state is None or self.is_expired(state):
+            self.swap(self.load())
+            return
+        limit = PANTRY_CHANGE_OVERLAP + PANTRY_MAX_PENDING_CHANGES
+        changes = get_recent_changes(state.sequence, limit)
+        if len(changes) == limit:
+            self.swap(self.load())
+            return
+        recipe_ids = {
+            recipe_id for pk, recipe_id in changes if pk not in state.seen
+        }
+        if not recipe_ids:
+            return
+        sequence = max(state.sequence, changes[-1][0])
+        self.swap(self.apply_changes(
+            state, recipe_ids, sequence, get_seen(changes, sequence)
+        ))
+
+    def run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Не удалось обновить индекс продуктов')
+            finally:
+                close_old_connections()
+            time.sleep(PANTRY_REFRESH_INTERVAL)
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(
+                target=self.run,
+                name='pantry-index',
+                daemon=True
+            )
+            self.thread.start()
+
+    def rank(self, state, ingredient_ids, missing):
+        candidates = set()
+        for ingredient_id in ingredient_ids:
+            positions, recipe_ids = state.prefixes.get(
+                ingredient_id, EMPTY_PREFIX
+            )
+            candidates.update(recipe_ids[:bisect_right(positions, missing)])
+        found = []
+        for recipe_id in candidates:
+            components = state.recipes[recipe_id]
+            size = len(components)
+            count = sum(
+                ingredient_id in ingredient_ids for ingredient_id in components
+            )
+            if size - count <= missing:
+                found.append((size - count, -count / size, -recipe_id))
+        found.sort()
+        return array('l', (-recipe_id for _, _, recipe_id in found))
+
+    def search(self, ingredient_ids, missing):
+        if PANTRY_INDEX_BACKGROUND:
+            self.start()
+        if self.state is None and self.thread is not None:
+            self.ready.wait(PANTRY_READY_TIMEOUT)
+        state = self.state
+        if state is None:
+            return query_pantry(ingredient_ids, missing)
+        key = (frozenset(ingredient_ids), missing)
+        with self.lock:
+            found = self.results.get(key)
+            if found is not None:
+                self.results.move_to_end(key)
+                return found
+        found = self.rank(state, key[0], missing)
+        with self.lock:
+            if self.state is state:
+                self.results[key] = found
+                if len(self.results) > PANTRY_RESULT_CACHE_SIZE:
+                    self.results.popitem(last=False)
+        return found
+
+
+pantry_index = PantryIndex()
+
+
+def search_pantry(ingredients, missing=0):
+    return pantry_index.search(ingredients, missing)
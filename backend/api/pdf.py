@@ -0,0 +1,51 @@
+import io
+import os
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from foodgram.settings import BASE_DIR, EXPORT_CHUNK_SIZE
+
+FREE_SANS_FONT = 'FreeSans'
+
+FREE_SANS_FONT_PATH = os.path.join(BASE_DIR, 'FreeSans.ttf')
+
+FREE_SANS_FONT_SIZE_HEADER = 18
+
+FREE_SANS_FONT_SIZE = 14
+
+ROW_HEADER = 800
+
+ROW_AFTER_HEADER = 40
+
+ROW_AFTER_INGRED = 30
+
+ROW_FOOTER = 50
+
+INDENT = 100
+
+pdfmetrics.registerFont(TTFont(FREE_SANS_FONT, FREE_SANS_FONT_PATH))
+
+
+def render_pdf(header, lines):
+    buffer = io.BytesIO()
+    canvas_blank = canvas.Canvas(buffer)
+    canvas_blank.setFont(FREE_SANS_FONT, FREE_SANS_FONT_SIZE_HEADER)
+    row = ROW_HEADER
+    canvas_blank.drawString(INDENT, row, header)
+    row -= ROW_AFTER_HEADER
+
+    canvas_blank.setFont(FREE_SANS_FONT, FREE_SANS_FONT_SIZE)
+    for line in lines:
+        if row < ROW_FOOTER:
+            canvas_blank.showPage()
+            canvas_blank.setFont(FREE_SANS_FONT, FREE_SANS_FONT_SIZE)
+            row = ROW_HEADER
+        canvas_blank.drawString(INDENT, row, line)
+        row -= ROW_AFTER_INGRED
+
+    canvas_blank.showPage()
+    canvas_blank.save()
+    buffer.seek(0)
+    yield from iter(lambda: buffer.read(EXPORT_CHUNK_SIZE), b'')
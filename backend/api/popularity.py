@@ -0,0 +1,95 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from foodgram.settings import TRENDING_GRAVITY, TRENDING_SHOPPING_LIST_WEIGHT
+from recipes.models import Favorite, Recipe, ShoppingList
+
+UPDATE_BATCH_SIZE = 500
+
+POPULARITY_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingList: 'shopping_list_count',
+}
+
+RECIPE_ORDERINGS = {
+    'popular': ('-favorites_count', '-id'),
+    'trending': ('-trending_score', '-id'),
+}
+
+
+def count_relations(model):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def get_batches(rows):
+    # Keyset batches: every UPDATE commits on its own and holds the row
+    # locks of one batch only, not of the whole table.
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk).order_by('pk')[
+            :UPDATE_BATCH_SIZE
+        ])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1][0]
+
+
+def update_popularity(model, recipe_id, delta):
+    counter = POPULARITY_COUNTERS[model]
+    recipes = Recipe.objects.filter(pk=recipe_id)
+    if delta < 0:
+        recipes = recipes.filter(**{f'{counter}__gt': 0})
+    recipes.update(**{counter: F(counter) + delta})
+
+
+def recount_popularity():
+    updated = 0
+    for batch in get_batches(Recipe.objects.values_list('pk')):
+        updated += Recipe.objects.filter(
+            pk__gte=batch[0][0],
+            pk__lte=batch[-1][0]
+        ).update(
+            favorites_count=count_relations(Favorite),
+            shopping_list_count=count_relations(ShoppingList)
+        )
+    return updated
+
+
+def get_trending_score(favorites, shopping_lists, age):
+    hours = max(age.total_seconds(), 0) / 3600
+    return (
+        (favorites + TRENDING_SHOPPING_LIST_WEIGHT * shopping_lists)
+        / (hours + 2) ** TRENDING_GRAVITY
+    )
+
+
+def update_trending_scores(now=None):
+    now = now or timezone.now()
+    Recipe.objects.filter(
+        favorites_count=0,
+        shopping_list_count=0
+    ).exclude(trending_score=0).update(trending_score=0)
+    rows = Recipe.objects.filter(
+        Q(favorites_count__gt=0) | Q(shopping_list_count__gt=0)
+    ).values_list('id', 'pub_date', 'favorites_count', 'shopping_list_count')
+    updated = 0
+    for batch in get_batches(rows):
+        Recipe.objects.bulk_update(
+            [
+                Recipe(pk=pk, trending_score=get_trending_score(
+                    favorites, shopping_lists, now - pub_date
+                ))
+                for pk, pub_date, favorites, shopping_lists in batch
+            ],
+            ('trending_score',)
+        )
+        updated += len(batch)
+    return updated
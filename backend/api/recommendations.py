@@ -0,0 +1,122 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from django.db import transaction
+
+from foodgram.settings import (
+    SIMILAR_BATCH_SIZE, SIMILAR_MAX_POSTING, SIMILAR_RECIPES_LIMIT,
+)
+from recipes.models import Amount, Recipe, SimilarRecipe
+
+from .similarity import (
+    build_index, find_neighbours, get_candidates, init_worker,
+)
+
+
+def split_batches(recipe_ids):
+    return [
+        recipe_ids[start:start + SIMILAR_BATCH_SIZE]
+        for start in range(0, len(recipe_ids), SIMILAR_BATCH_SIZE)
+    ]
+
+
+def mark_neighbours_stale(recipe_ids):
+    Recipe.objects.filter(
+        pk__in=recipe_ids,
+        neighbours_stale=False
+    ).update(neighbours_stale=True)
+
+
+def load_index():
+    ingredients = Amount.objects.values_list(
+        'recipe_id', 'ingredient_id'
+    ).order_by().iterator()
+    tags = (
+        (recipe_id, -tag_id)
+        for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag_id'
+        ).order_by().iterator()
+    )
+    return build_index(chain(ingredients, tags), SIMILAR_MAX_POSTING)
+
+
+def get_affected_recipe_ids(features, postings, stale_ids):
+    affected = set(stale_ids)
+    for batch in split_batches(stale_ids):
+        affected.update(SimilarRecipe.objects.filter(
+            similar_id__in=batch
+        ).values_list('recipe_id', flat=True))
+    for recipe_id in stale_ids:
+        affected.update(get_candidates(features, postings, recipe_id))
+    return sorted(affected)
+
+
+def store_neighbours(found):
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(
+            recipe_id__in=[recipe_id for recipe_id, _ in found]
+        ).delete()
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(
+                recipe_id=recipe_id, similar_id=similar_id, score=score
+            )
+            for recipe_id, neighbours in found
+            for score, similar_id in neighbours
+        )
+
+
+def clear_stale_flags(recipe_ids):
+    for batch in split_batches(recipe_ids):
+        Recipe.objects.filter(
+            pk__in=batch,
+            neighbours_stale=True
+        ).update(neighbours_stale=False)
+
+
+def compute_neighbours(features, postings, recipe_ids, workers):
+    batches = split_batches(recipe_ids)
+    index = (features, postings, SIMILAR_RECIPES_LIMIT)
+    if workers <= 1 or len(batches) <= 1:
+        init_worker(*index)
+        yield from map(find_neighbours, batches)
+        return
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=index
+    ) as pool:
+        yield from pool.map(find_neighbours, batches)
+
+
+def rebuild_neighbours(workers, full=False):
+    stale_ids = list(Recipe.objects.filter(
+        neighbours_stale=True
+    ).values_list('id', flat=True).order_by('id'))
+    clear_stale_flags(stale_ids)
+    try:
+        features, postings = load_index()
+        if full:
+            recipe_ids = list(Recipe.objects.values_list(
+                'id', flat=True
+            ).order_by('id'))
+        else:
+            recipe_ids = get_affected_recipe_ids(
+                features, postings, stale_ids
+            )
+        for found in compute_neighbours(
+            features, postings, recipe_ids, workers
+        ):
+            store_neighbours(found)
+    except BaseException:
+        for batch in split_batches(stale_ids):
+            mark_neighbours_stale(batch)
+        raise
+    return len(recipe_ids)
+
+
+def get_similar_recipe_ids(recipe_id, limit=SIMILAR_RECIPES_LIMIT):
+    return list(SimilarRecipe.objects.filter(
+        recipe_id=recipe_id
+    ).order_by('-score', '-similar_id').values_list(
+        'similar_id', flat=True
+    )[:limit])
@@ -0,0 +1,119 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.db import connections
+from django.db.models.functions import Lower
+
+from foodgram.settings import (
+    INGREDIENT_CATALOG_ENABLED, INGREDIENT_CATALOG_TTL,
+    INGREDIENT_SEARCH_LIMIT,
+)
+from recipes.models import Ingredient
+
+from .versions import get_versions
+
+INGREDIENT_INDEX_SQL = {
+    'postgresql': (
+        'CREATE INDEX IF NOT EXISTS {prefix} '
+        'ON {table} (lower({name}) text_pattern_ops)',
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        'CREATE INDEX IF NOT EXISTS {trigram} '
+        'ON {table} USING gin (lower({name}) gin_trgm_ops)',
+    ),
+}
+
+
+def create_ingredient_indexes(using='default', **kwargs):
+    connection = connections[using]
+    statements = INGREDIENT_INDEX_SQL.get(connection.vendor)
+    if statements is None:
+        return
+    quote_name = connection.ops.quote_name
+    names = {
+        'table': quote_name(Ingredient._meta.db_table),
+        'name': quote_name(Ingredient._meta.get_field('name').column),
+        'prefix': quote_name('ingredient_lower_name_prefix'),
+        'trigram': quote_name('ingredient_lower_name_trigram'),
+    }
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement.format(**names))
+
+
+class IngredientCatalog:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.loaded_at = 0
+        self.index = ((), ())
+
+    def is_stale(self, version):
+        return (
+            version != self.version
+            or time.monotonic() - self.loaded_at > INGREDIENT_CATALOG_TTL
+        )
+
+    def refresh(self):
+        (version, _), = get_versions('ingredients')
+        if not self.is_stale(version):
+            return
+        with self.lock:
+            if not self.is_stale(version):
+                return
+            ingredients = sorted(
+                Ingredient.objects.all(),
+                key=lambda ingredient: (ingredient.name.lower(), ingredient.pk)
+            )
+            self.index = (
+                tuple(ingredient.name.lower() for ingredient in ingredients),
+                tuple(ingredients),
+            )
+            self.version = version
+            self.loaded_at = time.monotonic()
+
+    def search(self, query, limit):
+        # Same tiers and order as search_ingredients_in_database: names
+        # starting with the query, then names containing it elsewhere.
+        self.refresh()
+        names, ingredients = self.index
+        found = []
+        start = bisect_left(names, query)
+        for position in range(start, len(names)):
+            if len(found) == limit or not names[position].startswith(query):
+                break
+            found.append(ingredients[position])
+        for position, name in enumerate(names):
+            if len(found) == limit:
+                break
+            if query in name and not name.startswith(query):
+                found.append(ingredients[position])
+        return found
+
+
+catalog = IngredientCatalog()
+
+
+def search_ingredients_in_database(query, limit):
+    # Names keep the case they were loaded with, so both tiers match on
+    # lower(name): the prefix tier is served by the text_pattern_ops
+    # index and the substring tier by the trigram index on it.
+    ingredients = Ingredient.objects.annotate(
+        lower_name=Lower('name')
+    ).order_by('lower_name', 'id')
+    found = list(ingredients.filter(lower_name__startswith=query)[:limit])
+    if len(found) < limit:
+        found += ingredients.filter(
+            lower_name__contains=query
+        ).exclude(
+            lower_name__startswith=query
+        )[:limit - len(found)]
+    return found
+
+
+def search_ingredients(query, limit=INGREDIENT_SEARCH_LIMIT):
+    query = query.strip().lower()
+    if INGREDIENT_CATALOG_ENABLED:
+        return catalog.search(query, limit)
+    return search_ingredients_in_database(query, limit)
@@ -1,29 +1,66 @@
-import base64
-import uuid
-
 from django.contrib.auth.hashers import check_password
-from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from rest_framework import serializers
 
-from foodgram.settings import MAX_INGREDIENT_AMOUNT
+from foodgram.settings import (
+    BULK_MAX_IDS, MAX_IMAGE_PIXELS, MAX_IMAGE_UPLOAD_SIZE,
+    MAX_INGREDIENT_AMOUNT, PANTRY_MAX_MISSING,
+)
+from recipes.images import get_rendition_url
 from recipes.models import (
     Amount, Favorite, Follow, Ingredient, Recipe, ShoppingList, Tag, User,
 )
 
+from .cart_totals import apply_component_deltas, get_component_deltas
+from .uploads import UploadError, decode_base64_image
+
 
 class CustomBase64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'too_large': 'Размер картинки не должен превышать {max_size} байт!',
+        'too_many_pixels': (
+            'Картинка не должна содержать больше {max_pixels} пикселей!'
+        ),
+    }
+
     def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            name_id = uuid.uuid4()
-            data = ContentFile(
-                base64.b64decode(imgstr), name=name_id.urn[9:] + '.' + ext)
+        if isinstance(data, str) and data.startswith('data:'):
+            try:
+                data = decode_base64_image(
+                    data, MAX_IMAGE_UPLOAD_SIZE, MAX_IMAGE_PIXELS
+                )
+            except UploadError as error:
+                self.fail(
+                    error.code,
+                    max_size=MAX_IMAGE_UPLOAD_SIZE,
+                    max_pixels=MAX_IMAGE_PIXELS
+                )
         return super(CustomBase64ImageField, self).to_internal_value(data)
 
 
+class RenditionImageField(serializers.ImageField):
+    def __init__(self, rendition, **kwargs):
+        self.rendition = rendition
+        kwargs['read_only'] = True
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        url = get_rendition_url(
+            recipe.image,
+            recipe.image_renditions,
+            self.context.get('image_rendition', self.rendition)
+        )
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
 class ShopAndFavoriteSerializer(serializers.ModelSerializer):
+    image = RenditionImageField('list')
 
     class Meta:
         model = Recipe
@@ -58,6 +95,7 @@ class UserCreateSerializer(serializers.ModelSerializer):
 
 
 class UserRecipeSerializer(serializers.ModelSerializer):
+    image = RenditionImageField('list')
 
     class Meta:
         model = Recipe
@@ -87,6 +125,8 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'username', 'email', 'first', 'last_name')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         try:
             if self.context['request'].auth is None:
                 return False
@@ -119,35 +159,34 @@ class UserFollowSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('user')
         return user.follower.filter(author=obj).exists()
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_IDS
+    )
 
-    class Meta:
-        model = Follow
-        fields = (
-            'user',
-            'author'
-        )
 
-    def validate(self, data):
-        if Follow.objects.filter(
-            user=data['user'],
-            author=data['author']
-        ).exists():
-            raise serializers.ValidationError(
-                'Вы уже подписаны на этого автора'
-            )
-        elif data['user'] == data['author']:
-            raise serializers.ValidationError(
-                'Вы пытаетесь подписаться на себя'
-            )
-        return data
+class PantrySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_IDS
+    )
+    missing = serializers.IntegerField(
+        min_value=0, max_value=PANTRY_MAX_MISSING, default=0
+    )
 
 
 class PasswordSerializer(serializers.ModelSerializer):
@@ -209,6 +248,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     ingredients = AmountSerializer(many=True, source='components')
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
+    image = RenditionImageField('detail')
     is_in_shopping_cart = serializers.SerializerMethodField(
         method_name='get_is_in_shopping_cart'
     )
@@ -231,11 +271,19 @@ class RecipeSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
     def get_is_favorited(self, obj):
 
         if self.context['request'].user.is_anonymous:
             return False
 
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+
         return Favorite.objects.filter(
             user=self.context['request'].user,
             recipe=obj).exists()
@@ -245,16 +293,16 @@ class RecipeSerializer(serializers.ModelSerializer):
         if self.context['request'].user.is_anonymous:
             return False
 
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+
         return ShoppingList.objects.filter(
             user=self.context['request'].user,
             recipe=obj).exists()
 
 
 class AmountSerializerCreate(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient',
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField(source='ingredient_id')
 
     class Meta:
         model = Amount
@@ -269,6 +317,10 @@ class RecipeSerializerCreate(serializers.ModelSerializer):
         many=True,
         source='components'
     )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False
+    )
     image = CustomBase64ImageField(max_length=None, use_url=True)
 
     class Meta:
@@ -290,22 +342,31 @@ class RecipeSerializerCreate(serializers.ModelSerializer):
             )
         return value
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('components')
         tags = validated_data.pop('tags')
         user = self.context['request'].user
         recipe = Recipe.objects.create(**validated_data, author=user)
-        self.add_tags_and_components_to_recipe(recipe, ingredients, tags)
+        recipe.tags.set(tags)
+        Amount.objects.bulk_create(
+            Amount(
+                recipe=recipe,
+                ingredient_id=ingredient['ingredient_id'],
+                amount=ingredient['amount']
+            )
+            for ingredient in ingredients
+        )
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('components')
         tags = validated_data.pop('tags')
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.ingredients.clear()
-        instance.tags.clear()
-        self.add_tags_and_components_to_recipe(instance, ingredients, tags)
+        instance.tags.set(tags)
+        self.merge_components(instance, ingredients)
         instance.save()
         return instance
 
@@ -315,14 +376,26 @@ class RecipeSerializerCreate(serializers.ModelSerializer):
                 'Должено быть не меньше 1 ингредиента!')
         set_id = set()
         for item in value:
-            if item['ingredient'].id in set_id:
+            if item['ingredient_id'] in set_id:
                 raise serializers.ValidationError(
                     'Ингредиенты в рецепте должны быть уникальными!')
-            set_id.add(item['ingredient'].id)
+            set_id.add(item['ingredient_id'])
             if item['amount'] < MAX_INGREDIENT_AMOUNT:
                 raise serializers.ValidationError(
                     'Количество ингредиента должно быть '
                     'целым числом, а значение не менее 1!')
+        if Ingredient.objects.filter(id__in=set_id).count() != len(set_id):
+            raise serializers.ValidationError(
+                'Указан несуществующий ингредиент!')
+        return value
+
+    def validate_tags(self, value):
+        set_id = set(value)
+        if len(set_id) != len(value):
+            raise serializers.ValidationError(
+                'Теги в рецепте должны быть уникальными!')
+        if Tag.objects.filter(id__in=set_id).count() != len(set_id):
+            raise serializers.ValidationError('Указан несуществующий тег!')
         return value
 
     def validate(self, data):
@@ -332,16 +405,44 @@ class RecipeSerializerCreate(serializers.ModelSerializer):
             raise serializers.ValidationError('Нельзя изменить чужой рецепт!')
         return data
 
-    def add_tags_and_components_to_recipe(self, obj, ingredients, tags):
-        for ingredient in ingredients:
-            Amount.objects.create(
-                recipe=obj,
-                ingredient=ingredient['ingredient'],
-                amount=ingredient['amount']
-            )
-        for tag in tags:
-            new_tag = get_object_or_404(Tag, id=tag.id)
-            obj.tags.add(new_tag)
+    def merge_components(self, recipe, ingredients):
+        current = {
+            component.ingredient_id: component
+            for component in recipe.components.all()
+        }
+        old_amounts = {
+            ingredient_id: component.amount
+            for ingredient_id, component in current.items()
+        }
+        new_amounts = {
+            ingredient['ingredient_id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        stale = [
+            component.pk for ingredient_id, component in current.items()
+            if ingredient_id not in new_amounts
+        ]
+        if stale:
+            Amount.objects.filter(pk__in=stale).delete()
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            component = current.get(ingredient_id)
+            if component is not None and component.amount != amount:
+                component.amount = amount
+                changed.append(component)
+        if changed:
+            Amount.objects.bulk_update(changed, ('amount',))
+        Amount.objects.bulk_create(
+            Amount(recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in current
+        )
+        apply_component_deltas(
+            recipe.pk, get_component_deltas(old_amounts, new_amounts)
+        )
 
     def to_representation(self, instance):
+        instance = Recipe.objects.with_related().with_user_flags(
+            self.context['request'].user
+        ).get(pk=instance.pk)
         return RecipeSerializer(instance, context=self.context).data
@@ -0,0 +1,269 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_init, post_save, pre_delete,
+)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.images import get_rendition_names
+from recipes.models import (
+    Amount, Favorite, Follow, Ingredient, Recipe, ShoppingList, SimilarRecipe,
+    Tag, User,
+)
+
+from .authentication import evict_tokens, evict_user_tokens
+from .cart_totals import add_recipes_to_totals, subtract_recipes_from_totals
+from .exports import invalidate_shopping_carts
+from .feed import bump_author_feeds, bump_recipe_feeds
+from .fulltext import index_recipes, index_recipes_in_batches
+from .pantry import record_recipe_change
+from .popularity import update_popularity
+from .recommendations import mark_neighbours_stale
+from .timeline import (
+    backfill_timeline, backfill_timelines, fan_out_recipe, prune_timeline,
+    prune_timelines,
+)
+from .toggles import relations_added, relations_removed
+from .versions import bump_versions
+
+logger = logging.getLogger(__name__)
+
+AUTHOR_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+def get_author_fields(user):
+    # __dict__ keeps deferred fields from being loaded one by one.
+    return tuple(user.__dict__.get(name) for name in AUTHOR_FIELDS)
+
+
+@receiver((post_save, post_delete), sender=ShoppingList)
+def shopping_list_changed(sender, instance, **kwargs):
+    invalidate_shopping_carts((instance.user_id,))
+
+
+@receiver(post_save, sender=ShoppingList)
+def shopping_list_added(sender, instance, created, **kwargs):
+    if created:
+        add_recipes_to_totals(instance.user_id, (instance.recipe_id,))
+
+
+@receiver(post_delete, sender=ShoppingList)
+def shopping_list_removed(sender, instance, **kwargs):
+    subtract_recipes_from_totals(instance.user_id, (instance.recipe_id,))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+def popular_relation_added(sender, instance, created, **kwargs):
+    if created:
+        update_popularity(sender, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+def popular_relation_removed(sender, instance, **kwargs):
+    update_popularity(sender, instance.recipe_id, -1)
+
+
+@receiver(relations_added, sender=ShoppingList)
+def shopping_list_batch_added(sender, user_id, target_ids, **kwargs):
+    invalidate_shopping_carts((user_id,))
+    add_recipes_to_totals(user_id, sorted(target_ids))
+
+
+@receiver(relations_removed, sender=ShoppingList)
+def shopping_list_batch_removed(sender, user_id, target_ids, **kwargs):
+    invalidate_shopping_carts((user_id,))
+    subtract_recipes_from_totals(user_id, sorted(target_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, created, **kwargs):
+    if created:
+        return
+    invalidate_shopping_carts(ShoppingList.objects.filter(
+        recipe=instance
+    ).values_list('user_id', flat=True))
+
+
+def store_renditions(image):
+    try:
+        Recipe.objects.store_renditions(image)
+    except Exception:
+        # The recipe is already committed: keep serving the original
+        # image rather than failing the request that saved it.
+        logger.exception(
+            'Не удалось подготовить превью изображения %s', image.name
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    image = instance.image
+    if not image or get_rendition_names(image, instance.image_renditions):
+        return
+    transaction.on_commit(lambda: store_renditions(image))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver(post_save, sender=Amount)
+def recipe_search_changed(sender, instance, **kwargs):
+    recipe_id = instance.pk if sender is Recipe else instance.recipe_id
+    transaction.on_commit(lambda: index_recipes((recipe_id,)))
+    record_recipe_change(recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        recipe_id = instance.pk
+        transaction.on_commit(lambda: fan_out_recipe(recipe_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        user_id, author_id = instance.user_id, instance.author_id
+        transaction.on_commit(lambda: backfill_timeline(user_id, author_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    user_id, author_id = instance.user_id, instance.author_id
+    transaction.on_commit(lambda: prune_timeline(user_id, author_id))
+
+
+@receiver(relations_added, sender=Follow)
+def follows_created(sender, user_id, target_ids, **kwargs):
+    author_ids = sorted(target_ids)
+    transaction.on_commit(lambda: backfill_timelines(user_id, author_ids))
+
+
+@receiver(relations_removed, sender=Follow)
+def follows_deleted(sender, user_id, target_ids, **kwargs):
+    author_ids = sorted(target_ids)
+    transaction.on_commit(lambda: prune_timelines(user_id, author_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_components_saved(sender, instance, created, **kwargs):
+    if not created:
+        mark_neighbours_stale((instance.pk,))
+
+
+@receiver((post_save, post_delete), sender=Amount)
+def amount_changed(sender, instance, **kwargs):
+    mark_neighbours_stale((instance.recipe_id,))
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_neighbour_deleted(sender, instance, **kwargs):
+    mark_neighbours_stale(SimilarRecipe.objects.filter(
+        similar=instance
+    ).values('recipe_id'))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tag_set_changed(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        mark_neighbours_stale((instance.pk,))
+    elif pk_set:
+        mark_neighbours_stale(pk_set)
+    else:
+        mark_neighbours_stale(instance.recipe_tags.values('id'))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_search_changed(sender, instance, created, **kwargs):
+    if created:
+        return
+    recipe_ids = Amount.objects.filter(
+        ingredient=instance
+    ).values_list('recipe_id', flat=True).distinct()
+    transaction.on_commit(
+        lambda: index_recipes_in_batches(recipe_ids.iterator())
+    )
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    bump_versions('ingredients', 'feed')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_versions('tags', 'feed')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(pre_delete, sender=Recipe)
+def recipe_version_changed(sender, instance, **kwargs):
+    bump_recipe_feeds(instance.pk)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        bump_versions('feed')
+        return
+    bump_versions(*(
+        f'feed:tag:{slug}' for slug in Tag.objects.filter(
+            pk__in=pk_set or ()
+        ).values_list('slug', flat=True)
+    ))
+    bump_recipe_feeds(instance.pk)
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    instance._author_fields = get_author_fields(instance)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, **kwargs):
+    author_fields = get_author_fields(instance)
+    if created or author_fields == instance._author_fields:
+        return
+    instance._author_fields = author_fields
+    bump_versions(f'user:{instance.pk}')
+    bump_author_feeds(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    bump_versions(f'user:{instance.pk}')
+
+
+@receiver(post_save, sender=User)
+def user_credentials_changed(sender, instance, update_fields=None,
+                             **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    evict_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    evict_tokens((instance.key,))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingList)
+@receiver((post_save, post_delete), sender=Follow)
+def viewer_relation_changed(sender, instance, **kwargs):
+    bump_versions(f'viewer:{instance.user_id}')
+
+
+@receiver((relations_added, relations_removed), sender=Favorite)
+@receiver((relations_added, relations_removed), sender=ShoppingList)
+@receiver((relations_added, relations_removed), sender=Follow)
+def viewer_relations_changed(sender, user_id, **kwargs):
+    bump_versions(f'viewer:{user_id}')
@@ -0,0 +1,76 @@
+import heapq
+from array import array
+from collections import Counter
+
+worker_index = {}
+
+
+def build_index(rows, max_posting):
+    features = {}
+    for recipe_id, feature in rows:
+        features.setdefault(recipe_id, set()).add(feature)
+    postings = {}
+    for recipe_id, recipe_features in features.items():
+        features[recipe_id] = frozenset(recipe_features)
+        for feature in recipe_features:
+            postings.setdefault(feature, array('l')).append(recipe_id)
+    postings = {
+        feature: posting for feature, posting in postings.items()
+        if len(posting) <= max_posting
+    }
+    return features, postings
+
+
+def init_worker(features, postings, limit):
+    worker_index.update(
+        features=features,
+        postings=postings,
+        limit=limit,
+        min_size=min(map(len, features.values()), default=0)
+    )
+
+
+def get_upper_bound(own_size, min_size, shared):
+    return shared / (own_size + max(min_size, shared) - shared)
+
+
+def get_candidates(features, postings, recipe_id):
+    candidates = set()
+    for feature in features.get(recipe_id, ()):
+        candidates.update(postings.get(feature, ()))
+    candidates.discard(recipe_id)
+    return candidates
+
+
+def find_neighbours(recipe_ids):
+    features = worker_index['features']
+    postings = worker_index['postings']
+    limit = worker_index['limit']
+    min_size = worker_index['min_size']
+    found = []
+    for recipe_id in recipe_ids:
+        own = features.get(recipe_id, frozenset())
+        shared = Counter()
+        frequent = []
+        for feature in own:
+            posting = postings.get(feature)
+            if posting is None:
+                frequent.append(feature)
+            else:
+                shared.update(posting)
+        shared.pop(recipe_id, None)
+        best = []
+        for candidate, count in shared.most_common():
+            if len(best) == limit and get_upper_bound(
+                len(own), min_size, count + len(frequent)
+            ) < best[0][0]:
+                break
+            other = features[candidate]
+            count += len(other.intersection(frequent))
+            scored = (count / (len(own) + len(other) - count), candidate)
+            if len(best) < limit:
+                heapq.heappush(best, scored)
+            elif scored > best[0]:
+                heapq.heapreplace(best, scored)
+        found.append((recipe_id, sorted(best, reverse=True)))
+    return found
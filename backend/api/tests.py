@@ -0,0 +1,700 @@
+import random
+import time
+import tracemalloc
+from base64 import b64encode
+from io import BytesIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.models import Sum
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from foodgram.middleware import (
+    ConnectionHealthCheckMiddleware, ReplicaRoutingMiddleware,
+)
+from foodgram.routers import PrimaryReplicaRouter
+from foodgram.settings import (
+    FULLTEXT_SEARCH_CONFIG, IMAGE_DECODE_CHUNK_SIZE, PANTRY_MAX_MISSING,
+    REPLICA_PIN_COOKIE, REPLICA_PIN_SECONDS,
+)
+from recipes.models import (
+    Amount, Favorite, Ingredient, Recipe, ShoppingCartTotal, ShoppingList, Tag,
+    User,
+)
+
+from .cart_totals import apply_component_deltas, get_component_deltas
+from .filters import RecipesFilter
+from .fulltext import (
+    SEARCH_TABLE, get_search_sql, index_recipes, search_recipes,
+)
+from .pantry import PantryIndex, query_pantry
+from .search import IngredientCatalog, search_ingredients_in_database
+from .uploads import decode_base64_image
+
+SEED_RECIPES = 3000
+
+
+class RecipeTagsFilterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@foodgram.ru',
+            password='Author-12345'
+        )
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', color=f'#00000{i}', slug=f'tag-{i}')
+            for i in range(3)
+        )
+        cls.tags = list(Tag.objects.order_by('slug'))
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {i}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.jpg',
+                author=cls.author
+            )
+            for i in range(SEED_RECIPES)
+        )
+        recipe_ids = Recipe.objects.values_list('id', flat=True)
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag.id)
+            for recipe_id in recipe_ids
+            for tag in cls.tags[:recipe_id % 3 + 1]
+        )
+
+    def filter_by_tags(self, *slugs):
+        data = QueryDict(mutable=True)
+        data.setlist('tags', slugs)
+        return RecipesFilter(
+            data,
+            queryset=Recipe.objects.with_user_flags(AnonymousUser())
+        ).qs
+
+    def test_several_matching_tags_give_no_duplicates(self):
+        recipe_ids = list(self.filter_by_tags(
+            *(tag.slug for tag in self.tags)
+        ).values_list('id', flat=True))
+        self.assertEqual(len(recipe_ids), SEED_RECIPES)
+        self.assertEqual(len(set(recipe_ids)), SEED_RECIPES)
+
+    def test_tags_filter_uses_single_semi_join(self):
+        queryset = self.filter_by_tags(self.tags[0].slug, self.tags[1].slug)
+        sql = str(queryset.query)
+        self.assertEqual(sql.count('EXISTS'), 1)
+        self.assertNotIn('JOIN', sql)
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertEqual(plan.count('Semi Join'), 1)
+        else:
+            self.assertEqual(plan.count('SUBQUERY'), 1)
+        self.assertEqual(queryset.count(), SEED_RECIPES)
+
+    def test_unknown_tag_gives_empty_list(self):
+        self.assertFalse(self.filter_by_tags('missing').exists())
+
+    def test_tag_created_after_caching_is_found(self):
+        self.filter_by_tags(self.tags[0].slug).exists()
+        Tag.objects.bulk_create(
+            [Tag(name='Новый', color='#FFFFFF', slug='new')]
+        )
+        Recipe.tags.through.objects.create(
+            recipe=Recipe.objects.first(),
+            tag=Tag.objects.get(slug='new')
+        )
+        self.assertEqual(self.filter_by_tags('new').count(), 1)
+
+
+class RecipeListQueriesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader',
+            email='reader@foodgram.ru',
+            password='Reader-12345'
+        )
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@foodgram.ru',
+            password='Author-12345'
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag-{i}')
+            for i in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Продукт {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.client.get('/api/users/me/')
+
+    def create_recipes(self, count):
+        start = Recipe.objects.count()
+        for i in range(start, start + count):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {i}',
+                text='Описание',
+                cooking_time=10,
+                image=f'recipes/images/recipe-{i}.jpg',
+                author=self.author
+            )
+            recipe.tags.set(self.tags)
+            Amount.objects.bulk_create(
+                Amount(recipe=recipe, ingredient=ingredient, amount=i + 1)
+                for ingredient in self.ingredients
+            )
+            if i % 2:
+                continue
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            ShoppingList.objects.create(user=self.user, recipe=recipe)
+
+    def get_list(self, count):
+        # Bypass the shared feed page so the flags come from the
+        # with_user_flags() annotations instead of overlay_viewer_flags().
+        with mock.patch('api.views.get_feed_cache_key', return_value=None):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/api/recipes/', {'limit': count})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), count)
+        return response.data['results'], len(context)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.create_recipes(2)
+        _, queries = self.get_list(2)
+        self.create_recipes(8)
+        with self.assertNumQueries(queries):
+            self.get_list(10)
+
+    def test_user_flags_come_from_annotations(self):
+        self.create_recipes(4)
+        flagged = set(Favorite.objects.filter(
+            user=self.user
+        ).values_list('recipe_id', flat=True))
+        recipes, _ = self.get_list(4)
+        self.assertEqual(len(flagged), 2)
+        for recipe in recipes:
+            with self.subTest(recipe=recipe['id']):
+                self.assertIs(recipe['is_favorited'], recipe['id'] in flagged)
+                self.assertIs(
+                    recipe['is_in_shopping_cart'], recipe['id'] in flagged
+                )
+
+
+class RecipeUserFlagFilterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader',
+            email='reader@foodgram.ru',
+            password='Reader-12345'
+        )
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@foodgram.ru',
+            password='Author-12345'
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {i}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.jpg',
+                author=cls.author
+            )
+            for i in range(100)
+        )
+        cls.recipe_ids = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True)
+        )
+        User.objects.bulk_create(
+            User(username=f'fan-{i}', email=f'fan-{i}@foodgram.ru')
+            for i in range(100)
+        )
+        cls.fan_ids = list(User.objects.filter(
+            username__startswith='fan-'
+        ).values_list('id', flat=True))
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def get_recipe_ids(self, **params):
+        response = self.client.get(
+            '/api/recipes/', {'limit': len(self.recipe_ids), **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return {recipe['id'] for recipe in response.data['results']}
+
+    def add_fan_favorites(self, fan_ids):
+        Favorite.objects.bulk_create(
+            Favorite(user_id=user_id, recipe_id=recipe_id)
+            for user_id in fan_ids
+            for recipe_id in self.recipe_ids
+        )
+
+    def test_other_users_favorites_do_not_leak(self):
+        favorited = set(self.recipe_ids[:5])
+        Favorite.objects.bulk_create(
+            Favorite(user=self.user, recipe_id=recipe_id)
+            for recipe_id in favorited
+        )
+        self.add_fan_favorites(self.fan_ids[:1])
+        self.assertEqual(self.get_recipe_ids(is_favorited=1), favorited)
+        self.assertEqual(
+            self.get_recipe_ids(is_favorited=0),
+            set(self.recipe_ids) - favorited
+        )
+
+    def test_query_count_does_not_grow_with_favorites(self):
+        Favorite.objects.create(user=self.user, recipe_id=self.recipe_ids[0])
+        self.get_recipe_ids(is_favorited=0)
+        with CaptureQueriesContext(connection) as context:
+            self.get_recipe_ids(is_favorited=0)
+        self.add_fan_favorites(self.fan_ids)
+        self.assertEqual(Favorite.objects.count(), 10001)
+        with self.assertNumQueries(len(context)):
+            self.assertEqual(
+                len(self.get_recipe_ids(is_favorited=0)),
+                len(self.recipe_ids) - 1
+            )
+
+
+class PantrySearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author',
+            email='author@foodgram.ru',
+            password='Author-12345'
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Продукт {i}', measurement_unit='г')
+            for i in range(30)
+        )
+        cls.ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {i}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.jpg',
+                author=author
+            )
+            for i in range(300)
+        )
+        cls.recipe_ids = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True)
+        )
+        cls.random = random.Random(0)
+        Amount.objects.bulk_create(
+            Amount(recipe_id=recipe_id, ingredient_id=ingredient_id, amount=1)
+            for recipe_id in cls.recipe_ids
+            for ingredient_id in cls.pick_ingredients()
+        )
+
+    @classmethod
+    def pick_ingredients(cls):
+        # The first ingredients are in almost every recipe, like salt.
+        return set(cls.random.choices(
+            cls.ingredient_ids,
+            weights=range(len(cls.ingredient_ids), 0, -1),
+            k=cls.random.randint(1, 9)
+        ))
+
+    def assert_index_matches_database(self, index):
+        state = index.state
+        for _ in range(30):
+            pantry = frozenset(self.random.sample(
+                self.ingredient_ids, self.random.randint(1, 15)
+            ))
+            for missing in range(PANTRY_MAX_MISSING + 1):
+                with self.subTest(pantry=sorted(pantry), missing=missing):
+                    self.assertEqual(
+                        list(index.rank(state, pantry, missing)),
+                        query_pantry(pantry, missing)
+                    )
+
+    def test_index_matches_database(self):
+        index = PantryIndex()
+        index.swap(index.load())
+        self.assert_index_matches_database(index)
+
+    def test_changes_keep_index_in_step_with_database(self):
+        index = PantryIndex()
+        index.swap(index.load())
+        changed = set(self.random.sample(self.recipe_ids, 40))
+        Amount.objects.filter(recipe_id__in=changed).delete()
+        Amount.objects.bulk_create(
+            Amount(recipe_id=recipe_id, ingredient_id=ingredient_id, amount=1)
+            for recipe_id in sorted(changed)[:30]
+            for ingredient_id in self.pick_ingredients()
+        )
+        state = index.state
+        index.swap(index.apply_changes(
+            state, changed, state.sequence, state.seen
+        ))
+        self.assert_index_matches_database(index)
+
+
+class CartTotalsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer',
+            email='buyer@foodgram.ru',
+            password='Buyer-12345'
+        )
+        cls.other = User.objects.create_user(
+            username='other',
+            email='other@foodgram.ru',
+            password='Other-12345'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Продукт {i}',
+                                      measurement_unit='г')
+            for i in range(4)
+        ]
+        cls.recipes = []
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {i}',
+                text='Описание',
+                cooking_time=10,
+                image=f'recipes/images/recipe-{i}.jpg',
+                author=cls.other
+            )
+            Amount.objects.bulk_create(
+                Amount(recipe=recipe, ingredient=ingredient, amount=i + j + 1)
+                for j, ingredient in enumerate(cls.ingredients[i:i + 2])
+            )
+            cls.recipes.append(recipe)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def assert_totals_match_carts(self):
+        expected = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in Amount.objects.filter(
+                recipe__shopping_list__isnull=False
+            ).values_list(
+                'recipe__shopping_list__user_id', 'ingredient_id'
+            ).annotate(total=Sum('amount')).order_by()
+        }
+        totals = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            ShoppingCartTotal.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+        self.assertEqual(totals, expected)
+
+    def test_add_and_remove(self):
+        ShoppingList.objects.create(user=self.other, recipe=self.recipes[0])
+        for recipe in self.recipes[:2]:
+            response = self.client.post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/'
+            )
+            self.assertEqual(response.status_code, 201)
+            self.assert_totals_match_carts()
+        response = self.client.delete(
+            f'/api/recipes/{self.recipes[0].pk}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assert_totals_match_carts()
+
+    def test_bulk_add_and_clear(self):
+        ShoppingList.objects.create(user=self.other, recipe=self.recipes[1])
+        response = self.client.post(
+            '/api/recipes/shopping_cart/',
+            {'ids': [recipe.pk for recipe in self.recipes]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_totals_match_carts()
+        response = self.client.delete('/api/recipes/shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.user.shopping_cart_totals.exists())
+        self.assert_totals_match_carts()
+
+    def test_edit_amounts(self):
+        for user in (self.user, self.other):
+            for recipe in self.recipes[:2]:
+                ShoppingList.objects.create(user=user, recipe=recipe)
+        recipe = self.recipes[0]
+        old_amounts = dict(recipe.components.values_list(
+            'ingredient_id', 'amount'
+        ))
+        first, second = self.ingredients[:2]
+        new_amounts = {first.pk: 10, self.ingredients[3].pk: 4}
+        Amount.objects.filter(recipe=recipe, ingredient=first).update(
+            amount=10
+        )
+        Amount.objects.filter(recipe=recipe, ingredient=second).delete()
+        Amount.objects.create(
+            recipe=recipe, ingredient=self.ingredients[3], amount=4
+        )
+        apply_component_deltas(
+            recipe.pk, get_component_deltas(old_amounts, new_amounts)
+        )
+        self.assert_totals_match_carts()
+
+    def test_orm_deletes(self):
+        for user in (self.user, self.other):
+            for recipe in self.recipes:
+                ShoppingList.objects.create(user=user, recipe=recipe)
+        self.assert_totals_match_carts()
+        ShoppingList.objects.filter(
+            user=self.user, recipe=self.recipes[1]
+        ).delete()
+        self.assert_totals_match_carts()
+        self.recipes[2].delete()
+        self.assert_totals_match_carts()
+
+
+class FullTextSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author',
+            email='author@foodgram.ru',
+            password='Author-12345'
+        )
+        beet = Ingredient.objects.create(name='свекла', measurement_unit='г')
+        recipes = {}
+        for name, text in (
+            ('Борщ', 'Суп на говяжьем бульоне'),
+            ('Винегрет', 'Салат к борщу и не только'),
+            ('Пирог', 'Тесто и яблоки'),
+        ):
+            recipes[name] = Recipe.objects.create(
+                name=name,
+                text=text,
+                cooking_time=10,
+                image='recipes/images/recipe.jpg',
+                author=author
+            )
+        Amount.objects.create(
+            recipe=recipes['Винегрет'], ingredient=beet, amount=1
+        )
+        index_recipes(recipe.pk for recipe in recipes.values())
+
+    def search(self, query):
+        return list(search_recipes(
+            Recipe.objects.all(), query
+        ).values_list('name', flat=True))
+
+    def test_search_covers_name_text_and_ingredients(self):
+        self.assertEqual(self.search('борщ'), ['Борщ'])
+        self.assertEqual(self.search('бульоне'), ['Борщ'])
+        self.assertEqual(self.search('свекла'), ['Винегрет'])
+        self.assertEqual(self.search('яблоки тесто'), ['Пирог'])
+        self.assertEqual(self.search('капуста'), [])
+
+    def test_match_is_not_selected(self):
+        queryset = search_recipes(Recipe.objects.all(), 'борщ')
+        sql = str(queryset.query)
+        self.assertNotIn('search_match', sql)
+        match = get_search_sql(queryset.db, 'match').split('%s')[0]
+        self.assertEqual(sql.count(match), 1)
+        self.assertEqual(queryset.count(), 1)
+
+    def test_postgresql_query(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            sql = str(search_recipes(Recipe.objects.all(), 'борщ').query)
+        self.assertEqual(sql.count('@@ websearch_to_tsquery('), 1)
+        self.assertEqual(sql.count('ts_rank_cd(document'), 1)
+        self.assertEqual(sql.count(f'{FULLTEXT_SEARCH_CONFIG}::regconfig'), 2)
+        self.assertNotIn('search_match', sql)
+        self.assertIn('ORDER BY "search_rank" DESC', sql)
+
+    @skipUnless(
+        connection.vendor == 'postgresql', 'tsvector search needs PostgreSQL'
+    )
+    def test_postgresql_search_uses_gin_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        queryset = search_recipes(Recipe.objects.all(), 'борщ')
+        self.assertEqual(
+            list(queryset.values_list('name', flat=True)), ['Борщ']
+        )
+        self.assertIn(f'{SEARCH_TABLE}_document', queryset.explain())
+
+
+class IngredientSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in (
+                'молоко', 'молоко сгущенное', 'кокосовое молоко',
+                'сухое обезжиренное молоко', 'мука', 'Tomato', 'Green tomato',
+                'tomatillo', 'potato',
+            )
+        )
+
+    def test_catalog_matches_database(self):
+        catalog = IngredientCatalog()
+        for query in ('мол', 'оло', 'ко', 'tomat', 'ato', 'о', 'нет'):
+            for limit in (2, 20):
+                with self.subTest(query=query, limit=limit):
+                    self.assertEqual(
+                        catalog.search(query, limit),
+                        search_ingredients_in_database(query, limit)
+                    )
+
+
+class DecodeBase64ImageMemoryTest(SimpleTestCase):
+
+    def make_payload(self, size):
+        image = BytesIO()
+        Image.new('RGB', (10, 10)).save(image, 'PNG')
+        content = image.getvalue()
+        content += bytes(size - len(content))
+        return 'data:image/png;base64,' + b64encode(content).decode()
+
+    def get_decode_peak(self, data):
+        tracemalloc.start()
+        try:
+            upload = decode_base64_image(data, len(data), 100)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        upload.close()
+        return peak
+
+    def test_peak_memory_does_not_grow_with_payload(self):
+        base_size = settings.FILE_UPLOAD_MAX_MEMORY_SIZE + 1
+        peaks = [
+            self.get_decode_peak(self.make_payload(base_size * factor))
+            for factor in (1, 2, 4, 8)
+        ]
+        for peak in peaks:
+            self.assertLess(peak, 8 * IMAGE_DECODE_CHUNK_SIZE)
+        self.assertLess(max(peaks) - min(peaks), 2 * IMAGE_DECODE_CHUNK_SIZE)
+
+
+@mock.patch(
+    'foodgram.middleware.REPLICA_DATABASES', ['replica_0', 'replica_1']
+)
+class ReplicaRoutingTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def get_reads(self, request, write=False):
+        reads = []
+
+        def view(request):
+            reads.extend(self.router.db_for_read(Recipe) for _ in range(5))
+            if write:
+                self.router.db_for_write(Recipe)
+                reads.append(self.router.db_for_read(Recipe))
+            reads.append(self.router.db_for_read(Token))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+        return reads, response
+
+    def test_safe_request_reads_one_replica(self):
+        for _ in range(20):
+            reads, response = self.get_reads(self.factory.get('/'))
+            self.assertIn(reads[0], ('replica_0', 'replica_1'))
+            self.assertEqual(set(reads[:5]), {reads[0]})
+            self.assertEqual(reads[5], 'default')
+            self.assertNotIn(REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_write_pins_reads_to_primary(self):
+        reads, response = self.get_reads(self.factory.get('/'), write=True)
+        self.assertEqual(reads[5:], ['default', 'default'])
+        self.assertEqual(
+            response.cookies[REPLICA_PIN_COOKIE]['max-age'],
+            REPLICA_PIN_SECONDS
+        )
+        reads, response = self.get_reads(self.factory.post('/'))
+        self.assertEqual(set(reads), {'default'})
+        self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_pin_cookie_reads_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[REPLICA_PIN_COOKIE] = '1'
+        reads, response = self.get_reads(request)
+        self.assertEqual(set(reads), {'default'})
+        self.assertNotIn(REPLICA_PIN_COOKIE, response.cookies)
+
+
+@mock.patch('foodgram.middleware.DB_CONN_HEALTH_CHECK_INTERVAL', 10)
+@mock.patch('foodgram.middleware.DB_CONN_HEALTH_CHECKS', True)
+class ConnectionHealthCheckTest(SimpleTestCase):
+
+    def make_connection(self, idle, usable=True, opened=True):
+        connection = mock.Mock(
+            connection=object() if opened else None,
+            health_checked_at=time.monotonic() - idle
+        )
+        connection.is_usable.return_value = usable
+        return connection
+
+    def check(self, *connections):
+        with mock.patch('foodgram.middleware.connections') as handler:
+            handler.all.return_value = connections
+            ConnectionHealthCheckMiddleware(
+                lambda request: HttpResponse()
+            )(RequestFactory().get('/'))
+
+    def test_recently_checked_connection_is_not_pinged(self):
+        connection = self.make_connection(1)
+        closed = self.make_connection(60, opened=False)
+        self.check(connection, closed)
+        connection.is_usable.assert_not_called()
+        closed.is_usable.assert_not_called()
+
+    def test_idle_connection_is_pinged_once(self):
+        connection = self.make_connection(60)
+        self.check(connection)
+        self.check(connection)
+        connection.is_usable.assert_called_once_with()
+        connection.close.assert_not_called()
+
+    def test_broken_connection_is_closed(self):
+        connection = self.make_connection(60, usable=False)
+        self.check(connection)
+        connection.close.assert_called_once_with()
+
+    def test_new_connection_counts_as_checked(self):
+        connection = self.make_connection(60)
+        self.check()
+        connection_created.send(sender=None, connection=connection)
+        self.check(connection)
+        connection.is_usable.assert_not_called()
@@ -0,0 +1,149 @@
+from itertools import groupby
+
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import Count, Q
+
+from foodgram.settings import (
+    TIMELINE_FANOUT_MAX_FOLLOWERS, TIMELINE_MAX_LENGTH,
+    TIMELINE_POPULAR_AUTHORS_TTL,
+)
+from recipes.models import Follow, Recipe, TimelineEntry
+
+POPULAR_AUTHORS_CACHE_KEY = 'timeline:popular_authors'
+
+FANOUT_BATCH_SIZE = 500
+
+
+def get_popular_author_ids():
+    author_ids = cache.get(POPULAR_AUTHORS_CACHE_KEY)
+    if author_ids is None:
+        author_ids = frozenset(Follow.objects.values('author_id').annotate(
+            followers=Count('id')
+        ).filter(
+            followers__gt=TIMELINE_FANOUT_MAX_FOLLOWERS
+        ).values_list('author_id', flat=True).order_by())
+        cache.set(
+            POPULAR_AUTHORS_CACHE_KEY,
+            author_ids,
+            TIMELINE_POPULAR_AUTHORS_TTL
+        )
+    return author_ids
+
+
+def trim_timelines(user_ids):
+    using = router.db_for_write(TimelineEntry)
+    quote_name = connections[using].ops.quote_name
+    opts = TimelineEntry._meta
+    table = quote_name(opts.db_table)
+    pk_column = quote_name(opts.pk.column)
+    user_column = quote_name(opts.get_field('user').column)
+    recipe_column = quote_name(opts.get_field('recipe').column)
+    pub_date_column = quote_name(opts.get_field('pub_date').column)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {pk_column} IN ('
+            f'SELECT {pk_column} FROM ('
+            f'SELECT {pk_column}, ROW_NUMBER() OVER ('
+            f'PARTITION BY {user_column} '
+            f'ORDER BY {pub_date_column} DESC, {recipe_column} DESC'
+            f') AS position FROM {table} '
+            f'WHERE {user_column} IN ({", ".join(["%s"] * len(user_ids))})'
+            f') ranked WHERE position > %s)',
+            (*user_ids, TIMELINE_MAX_LENGTH)
+        )
+        return cursor.rowcount
+
+
+def add_entries(entries):
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    trim_timelines(sorted({entry.user_id for entry in entries}))
+
+
+def fan_out_recipe(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'pub_date'
+    ).first()
+    if recipe is None or recipe['author_id'] in get_popular_author_ids():
+        return 0
+    follower_ids = Follow.objects.filter(
+        author_id=recipe['author_id']
+    ).values_list('user_id', flat=True).order_by('user_id').iterator()
+    created = 0
+    batch = []
+    for user_id in follower_ids:
+        batch.append(TimelineEntry(
+            user_id=user_id,
+            recipe_id=recipe_id,
+            pub_date=recipe['pub_date']
+        ))
+        if len(batch) == FANOUT_BATCH_SIZE:
+            add_entries(batch)
+            created += len(batch)
+            batch = []
+    if batch:
+        add_entries(batch)
+    return created + len(batch)
+
+
+def backfill_timelines(user_id, author_ids):
+    author_ids = set(author_ids) - get_popular_author_ids()
+    if not author_ids:
+        return 0
+    # Only the newest TIMELINE_MAX_LENGTH recipes of all the authors
+    # together can survive the trim, so one query covers the whole batch.
+    entries = [
+        TimelineEntry(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+        for pk, pub_date in Recipe.objects.filter(
+            author_id__in=author_ids
+        ).order_by('-pub_date', '-id').values_list(
+            'id', 'pub_date'
+        )[:TIMELINE_MAX_LENGTH]
+    ]
+    if entries:
+        add_entries(entries)
+    return len(entries)
+
+
+def backfill_timeline(user_id, author_id):
+    return backfill_timelines(user_id, (author_id,))
+
+
+def prune_timelines(user_id, author_ids):
+    deleted, _ = TimelineEntry.objects.filter(
+        user_id=user_id,
+        recipe__author_id__in=author_ids
+    ).delete()
+    return deleted
+
+
+def prune_timeline(user_id, author_id):
+    return prune_timelines(user_id, (author_id,))
+
+
+def rebuild_timelines():
+    TimelineEntry.objects.all().delete()
+    created = 0
+    follows = Follow.objects.values_list('user_id', 'author_id').order_by(
+        'user_id', 'author_id'
+    ).iterator()
+    for user_id, user_follows in groupby(follows, key=lambda row: row[0]):
+        created += backfill_timelines(
+            user_id, [author_id for _, author_id in user_follows]
+        )
+    return created
+
+
+def get_timeline(queryset, user):
+    popular_ids = Follow.objects.filter(
+        user=user,
+        author_id__in=get_popular_author_ids()
+    ).values_list('author_id', flat=True)
+    if not popular_ids.exists():
+        return queryset.filter(timeline_entries__user=user)
+    return queryset.filter(
+        Q(pk__in=TimelineEntry.objects.filter(
+            user=user
+        ).values('recipe_id'))
+        | Q(author_id__in=popular_ids)
+    )
@@ -0,0 +1,132 @@
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.dispatch import Signal
+
+relations_added = Signal(providing_args=('user_id', 'target_ids', 'using'))
+relations_removed = Signal(providing_args=('user_id', 'target_ids', 'using'))
+
+
+class RelationToggle:
+    def __init__(self, model, target_field, counter_field=None):
+        self.model = model
+        self.target_field = target_field
+        self.counter_field = counter_field
+
+    def get_sql_parts(self, using):
+        opts = self.model._meta
+        quote_name = connections[using].ops.quote_name
+        return (
+            quote_name(opts.db_table),
+            quote_name(opts.get_field('user').column),
+            quote_name(opts.get_field(self.target_field).column),
+        )
+
+    def get_existing(self, user_id, target_ids=None):
+        queryset = self.model.objects.filter(user_id=user_id)
+        if target_ids is not None:
+            queryset = queryset.filter(
+                **{f'{self.target_field}_id__in': target_ids}
+            )
+        return set(queryset.values_list(
+            f'{self.target_field}_id', flat=True
+        ))
+
+    def update_counter(self, target_ids, delta):
+        if self.counter_field is None or not target_ids:
+            return
+        targets = self.model._meta.get_field(
+            self.target_field
+        ).related_model.objects.filter(pk__in=target_ids)
+        if delta < 0:
+            targets = targets.filter(**{f'{self.counter_field}__gt': 0})
+        targets.update(**{self.counter_field: F(self.counter_field) + delta})
+
+    def insert_rows(self, using, user_id, target_ids):
+        table, user_column, target_column = self.get_sql_parts(using)
+        sql = (
+            f'INSERT INTO {table} ({user_column}, {target_column}) '
+            f'VALUES {{values}} ON CONFLICT DO NOTHING'
+        )
+        with connections[using].cursor() as cursor:
+            if connections[using].vendor == 'postgresql':
+                cursor.execute(
+                    sql.format(values=', '.join(
+                        ['(%s, %s)'] * len(target_ids)
+                    )) + f' RETURNING {target_column}',
+                    [
+                        value for target_id in target_ids
+                        for value in (user_id, target_id)
+                    ]
+                )
+                return {row[0] for row in cursor.fetchall()}
+            created = set()
+            for target_id in target_ids:
+                cursor.execute(
+                    sql.format(values='(%s, %s)'), (user_id, target_id)
+                )
+                if cursor.rowcount == 1:
+                    created.add(target_id)
+            return created
+
+    def delete_rows(self, using, user_id, target_ids=None):
+        table, user_column, target_column = self.get_sql_parts(using)
+        sql = f'DELETE FROM {table} WHERE {user_column} = %s'
+        with connections[using].cursor() as cursor:
+            if connections[using].vendor == 'postgresql':
+                params = [user_id]
+                if target_ids is not None:
+                    sql += (
+                        f' AND {target_column} IN '
+                        f'({", ".join(["%s"] * len(target_ids))})'
+                    )
+                    params += target_ids
+                cursor.execute(f'{sql} RETURNING {target_column}', params)
+                return {row[0] for row in cursor.fetchall()}
+            if target_ids is None:
+                target_ids = self.get_existing(user_id)
+            deleted = set()
+            for target_id in target_ids:
+                cursor.execute(
+                    f'{sql} AND {target_column} = %s', (user_id, target_id)
+                )
+                if cursor.rowcount > 0:
+                    deleted.add(target_id)
+            return deleted
+
+    def add(self, user_id, target_id):
+        return bool(self.add_many(user_id, [target_id]))
+
+    def remove(self, user_id, target_id):
+        return bool(self.remove_many(user_id, [target_id]))
+
+    def add_many(self, user_id, target_ids):
+        if not target_ids:
+            return set()
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            created = self.insert_rows(using, user_id, target_ids)
+            if created:
+                self.update_counter(created, 1)
+                relations_added.send(
+                    sender=self.model,
+                    user_id=user_id,
+                    target_ids=created,
+                    using=using
+                )
+        return created
+
+    def remove_many(self, user_id, target_ids=None):
+        if target_ids is not None and not target_ids:
+            return set()
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            deleted = self.delete_rows(using, user_id, target_ids)
+            if deleted:
+                self.update_counter(deleted, -1)
+                relations_removed.send(
+                    sender=self.model,
+                    user_id=user_id,
+                    target_ids=deleted,
+                    using=using
+                )
+        return deleted
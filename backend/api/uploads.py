@@ -0,0 +1,105 @@
+import binascii
+from base64 import b64decode
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile, TemporaryUploadedFile,
+)
+from PIL import Image
+
+from foodgram.settings import IMAGE_DECODE_CHUNK_SIZE
+
+BASE64_MARKER = ';base64,'
+
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png', 'image/png'),
+    (b'\xff\xd8\xff', 'jpg', 'image/jpeg'),
+    (b'GIF87a', 'gif', 'image/gif'),
+    (b'GIF89a', 'gif', 'image/gif'),
+)
+
+
+class UploadError(ValueError):
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def detect_image_format(header):
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp', 'image/webp'
+    for signature, extension, content_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension, content_type
+    return None
+
+
+def get_pixel_count(file):
+    position = file.tell()
+    try:
+        file.seek(0)
+        width, height = Image.open(file).size
+    except Exception:
+        return None
+    finally:
+        file.seek(position)
+    return width * height
+
+
+def check_pixel_count(file, max_pixels):
+    pixels = get_pixel_count(file)
+    if pixels is not None and pixels > max_pixels:
+        raise UploadError('too_many_pixels')
+    return pixels
+
+
+def make_upload(name, content_type, size):
+    if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        return TemporaryUploadedFile(name, content_type, size, None)
+    return InMemoryUploadedFile(
+        BytesIO(), None, name, content_type, size, None
+    )
+
+
+def get_payload_bounds(data):
+    start = data.find(BASE64_MARKER)
+    if start == -1 or (len(data) - start - len(BASE64_MARKER)) % 4:
+        raise UploadError('invalid_image')
+    start += len(BASE64_MARKER)
+    size = (len(data) - start) // 4 * 3 - data.count('=', len(data) - 2)
+    return start, size
+
+
+def decode_base64_image(data, max_size, max_pixels):
+    start, size = get_payload_bounds(data)
+    if size > max_size:
+        raise UploadError('too_large')
+    chunks = (
+        data[offset:offset + IMAGE_DECODE_CHUNK_SIZE]
+        for offset in range(start, len(data), IMAGE_DECODE_CHUNK_SIZE)
+    )
+    try:
+        header = b64decode(next(chunks, ''), validate=True)
+    except binascii.Error:
+        raise UploadError('invalid_image')
+    image_format = detect_image_format(header)
+    if image_format is None:
+        raise UploadError('invalid_image')
+    extension, content_type = image_format
+    pixels = check_pixel_count(BytesIO(header), max_pixels)
+    upload = make_upload('image.' + extension, content_type, size)
+    try:
+        upload.write(header)
+        for chunk in chunks:
+            upload.write(b64decode(chunk, validate=True))
+        if pixels is None:
+            check_pixel_count(upload.file, max_pixels)
+    except binascii.Error:
+        upload.close()
+        raise UploadError('invalid_image')
+    except UploadError:
+        upload.close()
+        raise
+    upload.seek(0)
+    return upload
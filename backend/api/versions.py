@@ -0,0 +1,92 @@
+import time
+import uuid
+from functools import wraps
+
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+from foodgram.settings import VERSION_LOCAL_TTL
+
+SHARED_CACHE = 'shared'
+
+VERSION_KEY_PREFIX = 'version:'
+
+
+def create_cache_table(using=DEFAULT_DB_ALIAS, **kwargs):
+    call_command('createcachetable', database=using, verbosity=0)
+
+
+def is_process_local(cache):
+    return isinstance(cache, (DummyCache, LocMemCache))
+
+
+def is_database_backed(cache):
+    return isinstance(cache, DatabaseCache)
+
+
+def get_version_timeout(cache):
+    return VERSION_LOCAL_TTL if is_process_local(cache) else None
+
+
+def new_version():
+    return uuid.uuid4().hex, int(time.time())
+
+
+def get_versions(*names):
+    cache = caches[SHARED_CACHE]
+    keys = [VERSION_KEY_PREFIX + name for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_version(), get_version_timeout(cache))
+            versions[key] = cache.get(key) or new_version()
+    return [versions[key] for key in keys]
+
+
+def set_new_versions(names):
+    cache = caches[SHARED_CACHE]
+    cache.set_many(
+        {VERSION_KEY_PREFIX + name: new_version() for name in names},
+        get_version_timeout(cache)
+    )
+
+
+def bump_versions(*names):
+    # A bump before commit would let a concurrent request cache the old
+    # body under the new version: publish it once the change is visible.
+    transaction.on_commit(lambda: set_new_versions(names))
+
+
+def condition_on_versions(get_version_names, vary=(), **cache_control):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            names = get_version_names(self, request, **kwargs)
+            if names is None:
+                return view(self, request, *args, **kwargs)
+            versions = get_versions(*names)
+            etag = quote_etag('-'.join(token for token, _ in versions))
+            last_modified = max(timestamp for _, timestamp in versions)
+            response = get_conditional_response(
+                request,
+                etag=etag,
+                last_modified=last_modified
+            )
+            if response is None:
+                response = view(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(last_modified)
+                patch_cache_control(response, **cache_control)
+                patch_vary_headers(response, vary)
+            return response
+        return wrapper
+    return decorator
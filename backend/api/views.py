@@ -1,48 +1,158 @@
-from django.db.models import F, Sum
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.db.models import (
+    BooleanField, Count, OuterRef, Prefetch, Subquery, Value,
+)
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from reportlab.pdfgen import canvas
-from rest_framework import filters, status, viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from api.paginations import PageLimitPagination
-from foodgram.settings import (
-    AFSPDF, APPLICATIONPDF, FREE_SANS_FONT, FREE_SANS_FONT_SIZE,
-    FREE_SANS_FONT_SIZE_HEADER, INDENT, ROW_AFTER_HEADER, ROW_AFTER_INGRED,
-    ROW_HEADER,
+from api.paginations import (
+    CursorLimitPagination, CursorOptInMixin, PageLimitPagination,
+    UserCursorPagination,
 )
+from foodgram.settings import CATALOG_CACHE_MAX_AGE, SHOPPING_CART_FILENAME
 from recipes.models import (
-    Amount, Favorite, Follow, Ingredient, Recipe, ShoppingList, Tag, User,
+    Favorite, Follow, Ingredient, Recipe, ShoppingList, Tag, User,
 )
 
-from .filters import IngredientsFilter, RecipesFilter
+from .cart_totals import get_cart_totals
+from .exports import (
+    SHOPPING_CART_RENDERERS, cached_stream, get_shopping_cart_cache_key,
+)
+from .feed import get_cached_feed, get_feed_cache_key, overlay_viewer_flags
+from .filters import RecipeOrderingFilter, RecipesFilter
+from .fulltext import FullTextSearchFilter
+from .pantry import search_pantry
 from .permissions import AdminOrReadOnly, AdminUserOrReadOnly
+from .recommendations import get_similar_recipe_ids
+from .search import search_ingredients
 from .serializers import (
-    FollowSerializer, IngredientSerializer, PasswordSerializer,
-    RecipeSerializer, RecipeSerializerCreate, ShopAndFavoriteSerializer,
-    TagSerializer, UserCreateSerializer, UserFollowSerializer, UserSerializer,
+    BulkIdsSerializer, IngredientSerializer, PantrySerializer,
+    PasswordSerializer, RecipeSerializer, RecipeSerializerCreate,
+    ShopAndFavoriteSerializer, TagSerializer, UserCreateSerializer,
+    UserFollowSerializer, UserSerializer,
 )
+from .timeline import get_timeline
+from .toggles import RelationToggle
+from .versions import condition_on_versions
 
 
 class HTTPMethod:
     DELETE = 'DELETE'
+    GET = 'GET'
     POST = 'POST'
 
 
-class UserViewSet(viewsets.ModelViewSet):
+def bulk_toggle(request, toggle, queryset, forbidden_ids=(),
+                allow_clear=False):
+    if (allow_clear and request.method == HTTPMethod.DELETE
+            and not request.data):
+        removed = toggle.remove_many(request.user.pk)
+        return Response({
+            'results': [
+                {'id': target_id, 'status': 'deleted'}
+                for target_id in sorted(removed)
+            ]
+        })
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    found = set(queryset.filter(pk__in=ids).values_list('pk', flat=True))
+    valid_ids = [
+        target_id for target_id in ids
+        if target_id in found and target_id not in forbidden_ids
+    ]
+    if request.method == HTTPMethod.DELETE:
+        changed = toggle.remove_many(request.user.pk, valid_ids)
+        statuses = ('deleted', 'missing')
+    else:
+        changed = toggle.add_many(request.user.pk, valid_ids)
+        statuses = ('created', 'exists')
+    results = []
+    for target_id in ids:
+        if target_id not in found:
+            item_status = 'not_found'
+        elif target_id in forbidden_ids:
+            item_status = 'forbidden'
+        else:
+            item_status = statuses[target_id not in changed]
+        results.append({'id': target_id, 'status': item_status})
+    return Response({'results': results})
+
+
+favorite_toggle = RelationToggle(Favorite, 'recipe', 'favorites_count')
+shopping_cart_toggle = RelationToggle(
+    ShoppingList, 'recipe', 'shopping_list_count'
+)
+follow_toggle = RelationToggle(Follow, 'author')
+
+
+def tags_version(view, request, **kwargs):
+    return ('tags',)
+
+
+def ingredients_version(view, request, **kwargs):
+    return ('ingredients',)
+
+
+def recipe_versions(view, request, pk=None, **kwargs):
+    if not str(pk).isdigit():
+        return None
+    author_id = Recipe.objects.filter(pk=pk).values_list(
+        'author_id', flat=True
+    ).first()
+    if author_id is None:
+        return None
+    names = ['tags', 'ingredients', f'recipe:{pk}', f'user:{author_id}']
+    if request.user.is_authenticated:
+        names.append(f'viewer:{request.user.pk}')
+    return names
+
+
+catalog_condition = {
+    'public': True,
+    'max_age': CATALOG_CACHE_MAX_AGE,
+}
+
+
+class UserViewSet(CursorOptInMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
     pagination_class = LimitOffsetPagination
+    cursor_pagination_class = UserCursorPagination
 
     def get_serializer_class(self):
         if self.action == 'create':
             return UserCreateSerializer
         return UserSerializer
 
+    def get_authors_with_recipes(self, queryset):
+        recipes = Recipe.objects.all()
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is not None and recipes_limit.isdigit():
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:int(recipes_limit)]
+            ))
+        return queryset.annotate(
+            recipes_count=Count('recipes', distinct=True),
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes)
+        ).order_by('id')
+
+    def get_followed_authors(self, user):
+        return self.get_authors_with_recipes(
+            User.objects.filter(following__user=user)
+        )
+
     @action(detail=False, permission_classes=(IsAuthenticated,))
     def me(self, request):
         user = request.user
@@ -75,25 +185,46 @@ class UserViewSet(viewsets.ModelViewSet):
     )
     def subscribe(self, request, pk):
         user = request.user
-        author = get_object_or_404(User, pk=pk)
-        if request.method == HTTPMethod.POST:
-            follow_data = {'author': author.pk, 'user': user.pk}
-            follow_serializer = FollowSerializer(data=follow_data)
-            follow_serializer.is_valid(raise_exception=True)
-            serializer = UserFollowSerializer(
-                author,
-                context={
-                    'request': request,
-                    'user': user,
-                }
-            )
-            Follow.objects.create(user=user, author=author)
-            return Response(
-                serializer.data,
-                status=status.HTTP_201_CREATED
-                )
-        Follow.objects.filter(user=request.user, author=author).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        if not pk.isdigit():
+            raise NotFound
+        if request.method == HTTPMethod.DELETE:
+            if follow_toggle.remove(user.pk, pk):
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(User, pk=pk)
+            raise ValidationError('Вы не подписаны на этого автора')
+        if int(pk) == user.pk:
+            raise ValidationError('Вы пытаетесь подписаться на себя')
+        author = get_object_or_404(
+            self.get_authors_with_recipes(User.objects.all()),
+            pk=pk
+        )
+        if not follow_toggle.add(user.pk, author.pk):
+            raise ValidationError('Вы уже подписаны на этого автора')
+        serializer = UserFollowSerializer(
+            author,
+            context={
+                'request': request,
+                'user': user,
+            }
+        )
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='subscribe',
+    )
+    def subscribe_bulk(self, request):
+        return bulk_toggle(
+            request,
+            follow_toggle,
+            User.objects.all(),
+            forbidden_ids=(request.user.pk,)
+        )
 
     @action(
         detail=False,
@@ -101,7 +232,7 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def subscriptions(self, request):
-        authors_in_follows = User.objects.filter(following__user=request.user)
+        authors_in_follows = self.get_followed_authors(request.user)
         page = self.paginate_queryset(authors_in_follows)
         serializer = UserFollowSerializer(
             page,
@@ -110,6 +241,29 @@ class UserViewSet(viewsets.ModelViewSet):
         )
         return self.get_paginated_response(serializer.data)
 
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(IsAuthenticated,),
+    )
+    def timeline(self, request):
+        user = request.user
+        recipes = get_timeline(
+            Recipe.objects.with_related().with_user_flags(user),
+            user
+        ).order_by('-pub_date', '-id')
+        if request.query_params.get(self.cursor_switch_param) == 'cursor':
+            paginator = CursorLimitPagination()
+        else:
+            paginator = PageLimitPagination()
+        page = paginator.paginate_queryset(recipes, request, view=self)
+        serializer = RecipeSerializer(
+            page,
+            many=True,
+            context={'request': request, 'image_rendition': 'list'}
+        )
+        return paginator.get_paginated_response(serializer.data)
+
 
 class TagViewSet(viewsets.ModelViewSet):
     queryset = Tag.objects.all()
@@ -118,106 +272,223 @@ class TagViewSet(viewsets.ModelViewSet):
     pagination_class = None
     permission_classes = (AdminOrReadOnly,)
 
+    @condition_on_versions(tags_version, **catalog_condition)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @condition_on_versions(tags_version, **catalog_condition)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class IngredientViewSet(viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     http_method_names = ('get',)
-    filter_backends = (IngredientsFilter,)
     pagination_class = None
-    search_fields = ('^name',)
     permission_classes = (AdminOrReadOnly,)
 
+    @condition_on_versions(ingredients_version, **catalog_condition)
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        serializer = self.get_serializer(search_ingredients(name), many=True)
+        return Response(serializer.data)
+
+    @condition_on_versions(ingredients_version, **catalog_condition)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(CursorOptInMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     pagination_class = PageLimitPagination
-    filter_backends = (filters.SearchFilter, DjangoFilterBackend)
+    filter_backends = (
+        FullTextSearchFilter, DjangoFilterBackend, RecipeOrderingFilter
+    )
     filterset_class = RecipesFilter
     permission_classes = (AdminUserOrReadOnly,)
 
+    def get_queryset(self, user=None):
+        if self.action in ('list', 'retrieve', 'pantry', 'similar'):
+            return Recipe.objects.with_related().with_user_flags(
+                user or self.request.user
+            )
+        return Recipe.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        cache_key = get_feed_cache_key(request)
+        if cache_key is None:
+            return super().list(request, *args, **kwargs)
+        data = get_cached_feed(cache_key, self.get_feed_page)
+        if request.user.is_authenticated:
+            data = overlay_viewer_flags(data, request.user)
+        return Response(data)
+
+    def get_feed_page(self, user):
+        queryset = self.filter_queryset(self.get_queryset(user))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data).data
+
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeSerializerCreate
         return RecipeSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'pantry', 'similar'):
+            context['image_rendition'] = 'list'
+        return context
+
     @action(detail=False)
-    def download_shopping_cart(self, request):
-        shop_list = Amount.objects.filter(
-            recipe__shopping_list__user=request.user).values(
-            name=F('ingredient__name'),
-            measurement_unit=F('ingredient__measurement_unit')
-        ).annotate(amount=Sum('amount')).order_by()
-
-        response = HttpResponse(content_type=APPLICATIONPDF)
-        response['Content-Disposition'] = AFSPDF
-        canvas_blank = canvas.Canvas(response)
-        canvas_blank.setFont(FREE_SANS_FONT, FREE_SANS_FONT_SIZE_HEADER)
-
-        row = ROW_HEADER
-        canvas_blank.drawString(
-            INDENT,
-            row,
-            'Список покупок:')
-        row -= ROW_AFTER_HEADER
-
-        canvas_blank.setFont(FREE_SANS_FONT, FREE_SANS_FONT_SIZE)
-        item = 1
-
-        for ingredient in shop_list:
-            canvas_blank.drawString(
-                INDENT,
-                row,
-                f'{item}) '
-                f'{ingredient["name"]} - '
-                f'{ingredient["amount"]}, {ingredient["measurement_unit"]}')
-            row -= ROW_AFTER_INGRED
-            item += 1
-
-        canvas_blank.showPage()
-        canvas_blank.save()
-        return response
+    def pantry(self, request):
+        serializer = PantrySerializer(data={
+            'ingredients': request.query_params.getlist('ingredients'),
+            'missing': request.query_params.get('missing', 0),
+        })
+        serializer.is_valid(raise_exception=True)
+        paginator = PageLimitPagination()
+        recipe_ids = paginator.paginate_queryset(
+            search_pantry(**serializer.validated_data), request, view=self
+        )
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes],
+            many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
 
-    @action(methods=('post', 'delete'), detail=True)
-    def shopping_cart(self, request, pk=None):
-        if request.method == HTTPMethod.POST:
-            ShoppingList.objects.get_or_create(
-                user=request.user,
-                recipe=self.get_object()
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        if not pk.isdigit():
+            raise NotFound
+        recipe_ids = get_similar_recipe_ids(pk)
+        if not recipe_ids:
+            get_object_or_404(Recipe, pk=pk)
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        serializer = self.get_serializer(
+            [
+                recipes[recipe_id] for recipe_id in recipe_ids
+                if recipe_id in recipes
+            ],
+            many=True
+        )
+        return Response(serializer.data)
+
+    @condition_on_versions(
+        recipe_versions,
+        vary=('Authorization',),
+        private=True,
+        no_cache=True
+    )
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=SHOPPING_CART_RENDERERS,
+    )
+    def download_shopping_cart(self, request):
+        renderer = request.accepted_renderer
+        cache_key = get_shopping_cart_cache_key(request.user, renderer.format)
+        content = cache.get(cache_key)
+        if content is None:
+            chunks = cached_stream(
+                cache_key,
+                renderer.stream(get_cart_totals(request.user).iterator())
             )
+        else:
+            chunks = (content,)
 
-        serializer = ShopAndFavoriteSerializer(self.get_object())
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; '
+            f'filename="{SHOPPING_CART_FILENAME}.{renderer.format}"'
+        )
+        return response
 
-        user_has_shoppinglist = ShoppingList.objects.filter(
-            user=request.user,
-            recipe=self.get_object()
-        ).exists()
-        if (request.method == HTTPMethod.DELETE and user_has_shoppinglist):
-            get_object_or_404(
-                ShoppingList,
-                user=request.user,
-                recipe=self.get_object()
-            ).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+    def toggle_recipe_relation(self, request, pk, toggle, exists_message,
+                               missing_message):
+        if not pk.isdigit():
+            raise NotFound
+        if request.method == HTTPMethod.DELETE:
+            if toggle.remove(request.user.pk, pk):
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(Recipe, pk=pk)
+            raise ValidationError(missing_message)
+        recipe = get_object_or_404(Recipe, pk=pk)
+        if not toggle.add(request.user.pk, recipe.pk):
+            raise ValidationError(exists_message)
+        serializer = ShopAndFavoriteSerializer(recipe)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        return Response(serializer.data)
+    @action(
+        methods=('post', 'delete'),
+        detail=True,
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart(self, request, pk=None):
+        return self.toggle_recipe_relation(
+            request,
+            pk,
+            shopping_cart_toggle,
+            'Рецепт уже в списке покупок',
+            'Рецепта нет в списке покупок'
+        )
 
-    @action(methods=('post', 'delete'), detail=True)
+    @action(
+        methods=('post', 'delete'),
+        detail=True,
+        permission_classes=(IsAuthenticated,)
+    )
     def favorite(self, request, pk=None):
-        if request.method == HTTPMethod.POST:
-            Favorite.objects.get_or_create(
-                user=request.user,
-                recipe=self.get_object())
-        serializer = ShopAndFavoriteSerializer(self.get_object())
-        user_has_favorite = Favorite.objects.filter(
-            user=request.user,
-            recipe=self.get_object()
-        ).exists()
-        if (request.method == HTTPMethod.DELETE and user_has_favorite):
-            get_object_or_404(
-                Favorite,
-                user=request.user,
-                recipe=self.get_object()
-            ).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(serializer.data)
+        return self.toggle_recipe_relation(
+            request,
+            pk,
+            favorite_toggle,
+            'Рецепт уже в избранном',
+            'Рецепта нет в избранном'
+        )
+
+    @action(
+        methods=('get', 'post', 'delete'),
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart'
+    )
+    def shopping_cart_bulk(self, request):
+        if request.method == HTTPMethod.GET:
+            return Response({
+                'recipes_count': request.user.shopping_list.count(),
+                'ingredients': [
+                    {
+                        'id': ingredient['ingredient_id'],
+                        'name': ingredient['name'],
+                        'measurement_unit': ingredient['measurement_unit'],
+                        'amount': ingredient['amount'],
+                    }
+                    for ingredient in get_cart_totals(request.user)
+                ],
+            })
+        return bulk_toggle(
+            request,
+            shopping_cart_toggle,
+            Recipe.objects.all(),
+            allow_clear=True
+        )
+
+    @action(
+        methods=('post', 'delete'),
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        url_path='favorite'
+    )
+    def favorite_bulk(self, request):
+        return bulk_toggle(request, favorite_toggle, Recipe.objects.all())
@@ -0,0 +1,71 @@
+import random
+import time
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from foodgram.routers import finish_request, start_request
+from foodgram.settings import (
+    DB_CONN_HEALTH_CHECK_INTERVAL, DB_CONN_HEALTH_CHECKS, REPLICA_DATABASES,
+    REPLICA_PIN_COOKIE, REPLICA_PIN_SECONDS,
+)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def mark_connection_checked(sender, connection, **kwargs):
+    connection.health_checked_at = time.monotonic()
+
+
+class ConnectionHealthCheckMiddleware:
+    def __init__(self, get_response):
+        if not DB_CONN_HEALTH_CHECKS:
+            raise MiddlewareNotUsed
+        connection_created.connect(mark_connection_checked)
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # A round trip per connection on every request costs more than
+        # the rare broken connection: ping only those idle for a while.
+        now = time.monotonic()
+        for connection in connections.all():
+            if connection.connection is None or (
+                now - getattr(connection, 'health_checked_at', 0)
+                < DB_CONN_HEALTH_CHECK_INTERVAL
+            ):
+                continue
+            connection.health_checked_at = now
+            if not connection.is_usable():
+                connection.close()
+        return self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        if not REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # One replica for the whole request, so that its reads see a
+        # single snapshot instead of replicas lagging by different amounts.
+        start_request(
+            random.choice(REPLICA_DATABASES)
+            if request.method in SAFE_METHODS
+            and REPLICA_PIN_COOKIE not in request.COOKIES
+            else None
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = finish_request()
+        if wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                REPLICA_PIN_COOKIE,
+                '1',
+                max_age=REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
@@ -0,0 +1,37 @@
+import threading
+
+from foodgram.settings import REPLICA_APPS
+
+state = threading.local()
+
+
+def start_request(replica):
+    state.replica = replica
+    state.wrote = False
+
+
+def finish_request():
+    try:
+        return getattr(state, 'wrote', False)
+    finally:
+        start_request(None)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replica = getattr(state, 'replica', None)
+        if replica is not None and model._meta.app_label in REPLICA_APPS:
+            return replica
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state.replica = None
+        state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
@@ -1,27 +1,100 @@
 import os
 
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-
 MAX_INGREDIENT_AMOUNT = 1
 
-FREE_SANS_FONT = 'FreeSans'
+BULK_MAX_IDS = 500
+
+SHOPPING_CART_FILENAME = 'shopping_cart'
+
+SHOPPING_CART_CACHE_TIMEOUT = 60 * 60
+
+EXPORT_CHUNK_SIZE = 8192
+
+INGREDIENT_SEARCH_LIMIT = 20
+
+INGREDIENT_CATALOG_ENABLED = os.getenv(
+    'INGREDIENT_CATALOG_ENABLED', default='True'
+) == 'True'
+
+INGREDIENT_CATALOG_TTL = 5 * 60
+
+PANTRY_INDEX_TTL = 30 * 60
+
+PANTRY_MAX_PENDING_CHANGES = 1000
+
+PANTRY_MAX_MISSING = 5
+
+PANTRY_CHANGE_OVERLAP = 1000
+
+PANTRY_CHANGE_RETENTION = 2 * PANTRY_INDEX_TTL
+
+PANTRY_INDEX_BACKGROUND = os.getenv(
+    'PANTRY_INDEX_BACKGROUND', default='True'
+) == 'True'
+
+PANTRY_REFRESH_INTERVAL = 5
+
+PANTRY_READY_TIMEOUT = 1
+
+PANTRY_RESULT_CACHE_SIZE = 64
+
+TIMELINE_MAX_LENGTH = int(os.getenv('TIMELINE_MAX_LENGTH', default=500))
+
+TIMELINE_FANOUT_MAX_FOLLOWERS = int(os.getenv(
+    'TIMELINE_FANOUT_MAX_FOLLOWERS', default=10_000
+))
+
+TIMELINE_POPULAR_AUTHORS_TTL = 10 * 60
+
+TRENDING_SHOPPING_LIST_WEIGHT = 0.5
+
+TRENDING_GRAVITY = 1.5
+
+SIMILAR_RECIPES_LIMIT = 10
+
+SIMILAR_MAX_POSTING = int(os.getenv('SIMILAR_MAX_POSTING', default=5000))
+
+SIMILAR_BATCH_SIZE = 500
+
+SIMILAR_WORKERS = int(os.getenv(
+    'SIMILAR_WORKERS', default=os.cpu_count() or 1
+))
+
+FULLTEXT_SEARCH_CONFIG = os.getenv(
+    'FULLTEXT_SEARCH_CONFIG', default='russian'
+)
 
-FREE_SANS_FONT_SIZE_HEADER = 18
+CATALOG_CACHE_MAX_AGE = 60
 
-FREE_SANS_FONT_SIZE = 14
+RECIPE_FEED_CACHE_TIMEOUT = 5 * 60
 
-ROW_HEADER = 800
+MAX_IMAGE_UPLOAD_SIZE = int(os.getenv(
+    'MAX_IMAGE_UPLOAD_SIZE', default=10 * 1024 * 1024
+))
 
-ROW_AFTER_HEADER = 40
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', default=40_000_000))
 
-ROW_AFTER_INGRED = 30
+IMAGE_DECODE_CHUNK_SIZE = 64 * 1024
 
-INDENT = 100
+SHARED_CACHE_BACKEND = os.getenv(
+    'SHARED_CACHE_BACKEND',
+    default='django.core.cache.backends.memcached.MemcachedCache'
+)
 
-APPLICATIONPDF = 'application/pdf'
+SHARED_CACHE_MAX_ENTRIES = 100_000
 
-AFSPDF = 'attachment; filename="somefilename.pdf"'
+VERSION_LOCAL_TTL = 30
+
+TAG_IDS_CACHE_TTL = 10 * 60
+
+AUTH_TOKEN_CACHE_BACKEND = os.getenv(
+    'AUTH_TOKEN_CACHE_BACKEND',
+    default='django.core.cache.backends.locmem.LocMemCache'
+)
+
+AUTH_TOKEN_CACHE_TTL = 5 * 60
+
+AUTH_TOKEN_CACHE_MAX_ENTRIES = 10_000
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -43,13 +116,15 @@ INSTALLED_APPS = [
     'sorl.thumbnail',
     'rest_framework.authtoken',
     'recipes',
-    'api',
+    'api.apps.ApiConfig',
     'djoser',
 ]
 
 AUTH_USER_MODEL = 'recipes.User'
 
 MIDDLEWARE = [
+    'foodgram.middleware.ConnectionHealthCheckMiddleware',
+    'foodgram.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -102,10 +177,71 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
     }
 }
 
+DB_CONN_HEALTH_CHECKS = os.getenv(
+    'DB_CONN_HEALTH_CHECKS', default='True'
+) == 'True'
+
+DB_CONN_HEALTH_CHECK_INTERVAL = int(os.getenv(
+    'DB_CONN_HEALTH_CHECK_INTERVAL', default=10
+))
+
+REPLICA_DATABASES = []
+
+for index, host in enumerate(filter(None, os.getenv(
+    'DB_REPLICA_HOSTS', default=''
+).split(','))):
+    REPLICA_DATABASES.append(f'replica_{index}')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['foodgram.routers.PrimaryReplicaRouter']
+
+REPLICA_APPS = ('recipes',)
+
+REPLICA_PIN_COOKIE = 'db_pin_primary'
+
+REPLICA_PIN_SECONDS = 15
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    },
+    'shared': {
+        'BACKEND': SHARED_CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'SHARED_CACHE_LOCATION', default='memcached:11211'
+        ),
+        'TIMEOUT': None,
+        'OPTIONS': (
+            {} if SHARED_CACHE_BACKEND.endswith('MemcachedCache')
+            else {'MAX_ENTRIES': SHARED_CACHE_MAX_ENTRIES}
+        ),
+    },
+    'auth_tokens': {
+        'BACKEND': AUTH_TOKEN_CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'AUTH_TOKEN_CACHE_LOCATION', default='auth_tokens'
+        ),
+        'TIMEOUT': AUTH_TOKEN_CACHE_TTL,
+        'KEY_PREFIX': 'auth',
+        'OPTIONS': (
+            {'MAX_ENTRIES': AUTH_TOKEN_CACHE_MAX_ENTRIES}
+            if AUTH_TOKEN_CACHE_BACKEND.endswith('LocMemCache') else {}
+        ),
+    },
+}
 
 dcap = 'django.contrib.auth.password_validation.'
 AUTH_PASSWORD_VALIDATORS = [
@@ -136,6 +272,13 @@ USE_TZ = True
 MEDIA_URL = '/media-files/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media-files')
 
+THUMBNAIL_PREFIX = 'media/recipes/renditions/'
+RECIPE_IMAGE_FORMAT = os.getenv('RECIPE_IMAGE_FORMAT', 'JPEG')
+RECIPE_IMAGE_RENDITIONS = {
+    'list': {'geometry': '600x400', 'crop': 'center', 'quality': 85},
+    'detail': {'geometry': '1200', 'upscale': False, 'quality': 85},
+}
+
 STATIC_URL = '/static-files/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static-files')
 
@@ -145,7 +288,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.paginations.PageLimitPagination',
     'PAGE_SIZE': 6,
@@ -155,5 +298,3 @@ DJOSER = {
     'SEND_ACTIVATION_EMAIL': False,
     'LOGIN_FIELD': 'email',
 }
-
-pdfmetrics.registerFont(TTFont('FreeSans', 'FreeSans.ttf'))
@@ -0,0 +1,36 @@
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', default='0.0.0.0:8000')
+
+preload_app = os.getenv('GUNICORN_PRELOAD', default='True') == 'True'
+
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', default=multiprocessing.cpu_count() * 2 + 1
+))
+
+worker_class = 'gthread'
+
+threads = int(os.getenv('GUNICORN_THREADS', default=4))
+
+# A recycled worker reloads the pantry index from scratch, so workers are
+# not restarted after a fixed number of requests unless asked to.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', default=0))
+
+max_requests_jitter = int(os.getenv(
+    'GUNICORN_MAX_REQUESTS_JITTER', default=100
+))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', default=30))
+
+graceful_timeout = 30
+
+keepalive = 5
+
+
+def post_worker_init(worker):
+    from api.pantry import pantry_index
+    from foodgram.settings import PANTRY_INDEX_BACKGROUND
+
+    if PANTRY_INDEX_BACKGROUND:
+        pantry_index.start()
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+
+from django.core.files.storage import FileSystemStorage
+from sorl.thumbnail import default, get_thumbnail
+
+from foodgram.settings import RECIPE_IMAGE_FORMAT, RECIPE_IMAGE_RENDITIONS
+
+
+class ContentHashStorage(FileSystemStorage):
+
+    def get_hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            os.path.dirname(name), digest[:2], digest + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        name = self.get_hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+
+def get_rendition(image, rendition):
+    options = dict(RECIPE_IMAGE_RENDITIONS[rendition])
+    geometry = options.pop('geometry')
+    return get_thumbnail(
+        image, geometry, format=RECIPE_IMAGE_FORMAT, **options
+    )
+
+
+def generate_renditions(image):
+    return json.dumps({
+        'source': image.name,
+        **{
+            rendition: get_rendition(image, rendition).name
+            for rendition in RECIPE_IMAGE_RENDITIONS
+        }
+    })
+
+
+def get_rendition_names(image, renditions):
+    names = json.loads(renditions or '{}')
+    if names.get('source') != image.name:
+        return {}
+    return names
+
+
+def get_rendition_url(image, renditions, rendition):
+    names = get_rendition_names(image, renditions)
+    if rendition not in names:
+        # Renditions are generated after commit: until then, and for
+        # images saved before the names were stored, serve the original.
+        return image.url
+    return default.storage.url(names[rendition])
@@ -1,20 +1,112 @@
 import csv
+import json
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.versions import bump_versions
 from recipes.models import Ingredient
 
+JSON_READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file, delimiter=',', quotechar='"'):
+        if row:
+            yield row[0], row[1]
+
+
+def skip_separators(buffer, position):
+    while position < len(buffer) and buffer[position] in ' \t\r\n,':
+        position += 1
+    return position
+
+
+def read_json(file):
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов')
+    position = 1
+    while True:
+        position = skip_separators(buffer, position)
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(JSON_READ_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный JSON-файл')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON файлов'
 
     def add_arguments(self, parser):
         parser.add_argument('csv_file', nargs='+', type=str)
+        parser.add_argument(
+            '--format',
+            choices=tuple(READERS),
+            help='Формат файлов, по умолчанию определяется по расширению'
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Прочитать файлы и откатить транзакцию'
+        )
 
     def handle(self, *args, **options):
-        for csv_file in options['csv_file']:
-            datareader = csv.reader(open(csv_file,
-                                         encoding='utf-8'),
-                                    delimiter=',', quotechar='"')
-            for row in datareader:
-                ingredient = Ingredient(name=row[0], measurement_unit=row[1])
-                ingredient.save()
+        started = time.monotonic()
+        before = Ingredient.objects.count()
+        read = 0
+        with transaction.atomic():
+            for file_name in options['csv_file']:
+                read += self.load_file(file_name, options)
+            created = Ingredient.objects.count() - before
+            if options['dry_run']:
+                transaction.set_rollback(True)
+            else:
+                bump_versions('ingredients')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Проверено" if options["dry_run"] else "Загружено"}: '
+            f'прочитано {read}, новых {created}, '
+            f'{read / elapsed if elapsed else read:.0f} строк/с'
+        ))
+
+    def load_file(self, file_name, options):
+        file_format = options['format'] or file_name.rsplit('.', 1)[-1]
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {file_name}')
+        read = 0
+        with open(file_name, encoding='utf-8') as file:
+            rows = READERS[file_format](file)
+            while True:
+                chunk = list(islice(rows, options['chunk_size']))
+                if not chunk:
+                    break
+                Ingredient.objects.bulk_create(
+                    (
+                        Ingredient(name=name, measurement_unit=unit)
+                        for name, unit in chunk
+                    ),
+                    ignore_conflicts=True
+                )
+                read += len(chunk)
+                self.stdout.write(f'{file_name}: {read}', ending='\r')
+        self.stdout.write(f'{file_name}: {read}')
+        return read
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии картинок рецептов'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        recipes = Recipe.objects.exclude(image='').only('image')
+        names = set()
+        for recipe in recipes.iterator():
+            if recipe.image.name in names:
+                continue
+            names.add(recipe.image.name)
+            Recipe.objects.store_renditions(recipe.image)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано: {len(names)} картинок '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cart_totals import rebuild_cart_totals
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает итоги корзин покупок с нуля'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            created = rebuild_cart_totals()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано: {created} строк '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
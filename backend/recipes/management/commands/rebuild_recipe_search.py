@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.fulltext import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс рецептов'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано: {count} рецептов '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
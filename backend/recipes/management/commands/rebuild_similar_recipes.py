@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.recommendations import rebuild_neighbours
+from foodgram.settings import SIMILAR_WORKERS
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие рецепты для рецептов, '
+            'у которых изменились ингредиенты или теги')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать похожие рецепты для всех рецептов'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=SIMILAR_WORKERS,
+            help='Количество процессов для расчета'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated = rebuild_neighbours(options['workers'], options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано: {updated} рецептов '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.timeline import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок пользователей с нуля'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            created = rebuild_timelines()
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {created} записей лент '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
@@ -0,0 +1,57 @@
+import subprocess
+import sys
+from collections import Counter
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from foodgram.settings import BASE_DIR
+
+STARTUP_SCRIPT = 'import django; django.setup(); import foodgram.urls'
+
+IMPORT_TIME_PREFIX = 'import time:'
+
+
+def parse_import_times(output):
+    times = Counter()
+    for line in output.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX) or '[us]' in line:
+            continue
+        self_time, _, name = line[len(IMPORT_TIME_PREFIX):].split('|')
+        times[name.strip().split('.')[0]] += int(self_time)
+    return times
+
+
+class Command(BaseCommand):
+    help = 'Показывает время импорта при запуске по приложениям и пакетам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Сколько самых медленных пакетов показать'
+        )
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            (sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT),
+            cwd=BASE_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True
+        )
+        times = parse_import_times(result.stderr)
+        labels = {
+            app_config.name: app_config.label
+            for app_config in apps.get_app_configs()
+            if '.' not in app_config.name
+        }
+        self.stdout.write(
+            f'Всего: {sum(times.values()) / 1000:.1f} мс'
+        )
+        for package, microseconds in times.most_common(options['limit']):
+            label = labels.get(package)
+            name = f'{package} ({label})' if label else package
+            self.stdout.write(f'{name:<40} {microseconds / 1000:8.1f} мс')
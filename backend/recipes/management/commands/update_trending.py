@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.popularity import recount_popularity, update_trending_scores
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинг популярности рецептов с учётом давности'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Сначала пересчитать счётчики избранного и списков покупок'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['recount']:
+            recount_popularity()
+        updated = update_trending_scores()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено: {updated} рецептов '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
@@ -1,6 +1,9 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Q, Value
+
+from .images import ContentHashStorage, generate_renditions
 
 
 class User(AbstractUser):
@@ -39,6 +42,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингридиент'
         verbose_name_plural = 'Ингридиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -65,6 +74,51 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'components',
+                queryset=Amount.objects.select_related('ingredient')
+            ),
+        )
+
+    def store_renditions(self, image):
+        if not image:
+            return 0
+        return self.filter(image=image.name).update(
+            image_renditions=generate_renditions(image)
+        )
+
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+                author_is_subscribed=Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user,
+                author=OuterRef('author')
+            )),
+        )
+
+
 class Recipe(models.Model):
     name = models.CharField(
         max_length=200,
@@ -80,7 +134,8 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         verbose_name='Картинка',
-        upload_to='media/recipes/images/'
+        upload_to='media/recipes/images/',
+        storage=ContentHashStorage()
     )
     tags = models.ManyToManyField(
         Tag,
@@ -104,11 +159,57 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное',
+        default=0,
+        editable=False
+    )
+    shopping_list_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в списки покупок',
+        default=0,
+        editable=False
+    )
+    trending_score = models.FloatField(
+        verbose_name='Рейтинг популярности',
+        default=0,
+        editable=False
+    )
+    neighbours_stale = models.BooleanField(
+        verbose_name='Похожие рецепты требуют пересчета',
+        default=True,
+        editable=False
+    )
+    image_renditions = models.TextField(
+        verbose_name='Уменьшенные копии картинки',
+        blank=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date', )
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id'
+            ),
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_favorites_count_id'
+            ),
+            models.Index(
+                fields=('-trending_score', '-id'),
+                name='recipe_trending_score_id'
+            ),
+            models.Index(
+                fields=('id',),
+                name='recipe_neighbours_stale',
+                condition=Q(neighbours_stale=True)
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -157,6 +258,16 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_follow'
+            ),
+            models.CheckConstraint(
+                check=~models.Q(user=models.F('author')),
+                name='no_self_follow'
+            ),
+        )
 
 
 class ShoppingList(models.Model):
@@ -213,3 +324,108 @@ class Amount(models.Model):
         )
         verbose_name = 'Компонент'
         verbose_name_plural = 'Компоненты'
+
+
+class ShoppingCartTotal(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals'
+    )
+    amount = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.user.username}---{self.ingredient.name}'
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_cart_total'
+            ),
+        )
+        verbose_name = 'Итог корзины'
+        verbose_name_plural = 'Итоги корзин'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    pub_date = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.user.username}---{self.recipe.name}'
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_timeline_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_date'
+            ),
+        )
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbours'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    score = models.FloatField()
+
+    def __str__(self):
+        return f'{self.recipe.name}---{self.similar.name}'
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score'),
+                name='similar_recipe_score'
+            ),
+        )
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+
+
+class RecipeChange(models.Model):
+    recipe_id = models.PositiveIntegerField()
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.recipe_id}---{self.changed_at}'
+
+    class Meta:
+        verbose_name = 'Изменение рецепта'
+        verbose_name_plural = 'Изменения рецептов'